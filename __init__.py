@@ -1,3 +1,4 @@
+from . import controllers
 from . import models
 
 def initial_config(env):
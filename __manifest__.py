@@ -1,6 +1,6 @@
 {
     "name": "ForexManager: Cambio de divisas",
-    "version": "1.0",
+    "version": "1.1",
     "category": "Accounting/Finance",
     "summary": "Gestión de operaciones para empresas orientadas al cambio de divisas ",
     "description": "Módulo para gestionar operaciones de cambio de divisas (Forex) en Odoo (v18.0).",
@@ -23,7 +23,12 @@
         "views/transfer_line_views.xml",
         "views/transfer_views.xml",
         "views/transfer_admin_views.xml",
+        "views/cashcount_move_views.xml",
+        "views/rate_views.xml",
+        "views/rate_board_templates.xml",
+        "views/operation_summary_templates.xml",
         "views/menu_views.xml",
+        "data/ir_cron_data.xml",
     ],
     "post_init_hook": "initial_config",
     "installable": True,
@@ -0,0 +1,77 @@
+"""Benchmark of the document reading: raw read_mrz against ocr.read_document (preprocessing + MRZ band).
+
+The corpus is a local folder of sample document images (.jpg, .jpeg, .png). It is not shipped with
+the module, since it would contain personal data.
+
+Usage (from the module folder, Odoo is not needed; passporteye and Pillow are):
+    python benchmarks/bench_ocr.py path/to/corpus [--repeat 3]
+"""
+import argparse
+import importlib.util
+import os
+import statistics
+import time
+from io import BytesIO
+
+from passporteye import read_mrz
+
+spec = importlib.util.spec_from_file_location("ocr", os.path.join(os.path.dirname(__file__), "..", "ocr.py"))
+ocr = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ocr)
+
+EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def before(image_bytes):
+    # Previous Operation.get_passport_info: the raw upload straight to read_mrz
+    mrz = read_mrz(BytesIO(image_bytes))
+    return mrz.to_dict() if mrz is not None else None
+
+
+def after(image_bytes):
+    return ocr.read_document(image_bytes)
+
+
+def measure(reader, image_bytes, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        mrz_dict = reader(image_bytes)
+        times.append(time.perf_counter() - start)
+    return min(times), (mrz_dict or {}).get("valid_score", 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    files = sorted(f for f in os.listdir(args.corpus) if f.lower().endswith(EXTENSIONS))
+    if not files:
+        parser.error(f"No images found in {args.corpus}")
+
+    results = {"before": [], "after": []}
+    print(f"{'image':<30} {'before s':>9} {'score':>6} {'after s':>9} {'score':>6}")
+    for name in files:
+        with open(os.path.join(args.corpus, name), "rb") as f:
+            image_bytes = f.read()
+        row = []
+        for label, reader in (("before", before), ("after", after)):
+            seconds, score = measure(reader, image_bytes, args.repeat)
+            results[label].append((seconds, score))
+            row += [seconds, score]
+        print(f"{name[:30]:<30} {row[0]:>9.3f} {row[1]:>6} {row[2]:>9.3f} {row[3]:>6}")
+
+    print()
+    print(f"{'':<10} {'mean s':>8} {'median s':>9} {'mean score':>11} {'reliable':>9}")
+    for label, rows in results.items():
+        seconds = [s for s, _ in rows]
+        scores = [score for _, score in rows]
+        reliable = sum(score > ocr.MIN_VALID_SCORE for score in scores)
+        print(f"{label:<10} {statistics.mean(seconds):>8.3f} {statistics.median(seconds):>9.3f} "
+              f"{statistics.mean(scores):>11.1f} {reliable:>5}/{len(rows)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Benchmark of pricing.nearest_payable_pairs against the previous up/down snapping loop.
+
+Usage (from the module folder, Odoo is not needed):
+    python benchmarks/bench_pricing.py [--samples 2000]
+"""
+import argparse
+import importlib.util
+import os
+import random
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+spec = importlib.util.spec_from_file_location("pricing", os.path.join(os.path.dirname(__file__), "..", "pricing.py"))
+pricing = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(pricing)
+
+MARGIN = 1.4
+MAX_ITERATIONS = 100000 # Safety cap for the old loop (it has no bound of its own)
+
+# Realistic breakdowns (the base currency with coins, foreign currencies only with bills)
+EUR = [0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200]
+PAIRS = {
+    "EUR/JPY": (EUR, [1000, 2000, 5000, 10000], 162.48),
+    "EUR/GBP": (EUR, [5, 10, 20, 50], 0.8543),
+    "EUR/CHF": (EUR, [10, 20, 50, 100, 200, 1000], 0.9412),
+}
+
+
+def old_recalculate_amount(values, amount, up_down):
+    # Previous Calculation.recalculate_amount (without the breakdown search)
+    amount = Decimal(str(amount)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    values = [Decimal(str(v)) for v in values] * 2 # bills + coins were the same list
+    remainders = []
+    for value in values:
+        remainder = (amount % value).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        if remainder == 0:
+            return float(amount), False
+        remainders.append(remainder if up_down == "down" else value - remainder)
+    new_amount = amount - min(remainders) if up_down == "down" else amount + min(remainders)
+    return float(new_amount), True
+
+
+def old_calculate(amount_received, source_values, target_values, rate, up_down, counter):
+    # Previous calculate() closure of aux_calc_amount_delivered (client offers base currency)
+    amount_received, _ = old_recalculate_amount(source_values, amount_received, up_down)
+    amount_delivered, recalculated_delivered = old_recalculate_amount(target_values, amount_received * rate, up_down)
+    while recalculated_delivered:
+        counter[0] += 1
+        if counter[0] > MAX_ITERATIONS:
+            raise RuntimeError("no convergence")
+        amount_received, recalculated_received = old_recalculate_amount(source_values, amount_delivered / rate, up_down)
+        if not recalculated_received:
+            break
+        amount_delivered, recalculated_delivered = old_recalculate_amount(target_values, amount_received * rate, up_down)
+    return amount_received, amount_delivered
+
+
+def old_keystroke(amount, source_values, target_values, rate, counter):
+    received, delivered = old_calculate(amount, source_values, target_values, rate, "down", counter)
+    if received != amount:
+        old_calculate(amount, source_values, target_values, rate, "down", counter)
+        old_calculate(amount, source_values, target_values, rate, "up", counter)
+
+
+def new_keystroke(amount, source_cents, target_cents, rate):
+    return pricing.nearest_payable_pairs(pricing.to_cents(amount), source_cents, target_cents, rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    print(f"{'pair':<9} {'old us/op':>10} {'new us/op':>10} {'speedup':>8} {'old max it':>11} {'old no conv':>12}")
+    for name, (source_values, target_values, base_rate) in PAIRS.items():
+        buy_rate = round(base_rate / MARGIN, 6) # Client offers base currency
+        amounts = [round(random.uniform(20, 2000), random.choice([0, 2])) for _ in range(args.samples)]
+        source_cents = tuple(sorted({int(round(v * 100)) for v in source_values}))
+        target_cents = tuple(sorted({int(round(v * 100)) for v in target_values}))
+
+        max_iterations, failures = 0, 0
+        start = time.perf_counter()
+        for amount in amounts:
+            counter = [0]
+            try:
+                old_keystroke(amount, source_values, target_values, buy_rate, counter)
+            except RuntimeError:
+                failures += 1
+            max_iterations = max(max_iterations, counter[0])
+        old_time = (time.perf_counter() - start) / len(amounts) * 1e6
+
+        start = time.perf_counter()
+        for amount in amounts:
+            new_keystroke(amount, source_cents, target_cents, buy_rate)
+        new_time = (time.perf_counter() - start) / len(amounts) * 1e6
+
+        print(f"{name:<9} {old_time:>10.1f} {new_time:>10.1f} {old_time / new_time:>7.1f}x {max_iterations:>11} {failures:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Benchmark of the cost of loading the module in an Odoo worker: import time and memory (RSS),
+with and without the addon, plus the heavy libraries that end up loaded in the worker.
+
+Every measure runs in a fresh interpreter, as a new Odoo worker would.
+
+Usage (from the module folder, with Odoo importable by this python):
+    python benchmarks/bench_startup.py [--addons-path path/to/addons] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ("passporteye", "skimage", "numpy", "PIL", "pytesseract", "scipy")
+
+# Runs in the child interpreter. Prints one JSON line with the measures
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import odoo
+odoo_seconds = time.perf_counter() - start
+addon_seconds = 0
+if {load_addon}:
+    odoo.tools.config.parse_config(["--addons-path", {addons_path!r}])
+    start = time.perf_counter()
+    import odoo.addons.{module}
+    addon_seconds = time.perf_counter() - start
+with open("/proc/self/status") as f:
+    rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+print(json.dumps({{
+    "odoo": odoo_seconds,
+    "addon": addon_seconds,
+    "rss_kb": rss,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "heavy": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def probe(load_addon, addons_path, module):
+    code = PROBE.format(load_addon=load_addon, addons_path=addons_path, module=module, heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    module_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--addons-path", default=os.path.dirname(module_path))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    module = os.path.basename(module_path)
+
+    print(f"{'':<16} {'odoo s':>8} {'addon s':>8} {'RSS MB':>8} {'max RSS MB':>11}  heavy modules loaded")
+    for label, load_addon in (("without addon", False), ("with addon", True)):
+        runs = [probe(load_addon, args.addons_path, module) for _ in range(args.repeat)]
+        print(f"{label:<16} {statistics.median(r['odoo'] for r in runs):>8.3f} "
+              f"{statistics.median(r['addon'] for r in runs):>8.3f} "
+              f"{statistics.median(r['rss_kb'] for r in runs) / 1024:>8.1f} "
+              f"{statistics.median(r['max_rss_kb'] for r in runs) / 1024:>11.1f}  "
+              f"{', '.join(runs[-1]['heavy']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+from odoo import http
+from odoo.http import request
+
+
+class RateBoard(http.Controller):
+    """Rate board (buy/sell rates of every currency at every discount) for the screens at the workcenters."""
+
+    @http.route("/forexmanager/rate_board", type="json", auth="user")
+    def rate_board(self):
+        return request.env["forexmanager.currency"].get_rate_board()
+
+    @http.route("/forexmanager/rate_board/html", type="http", auth="user")
+    def rate_board_html(self, discount=None):
+        board = request.env["forexmanager.currency"].get_rate_board()
+        # A single discount column can be shown (?discount=10). By default, every level
+        columns = [i for i, d in enumerate(board["discounts"]) if discount is None or str(d) == discount]
+        return request.render("forexmanager.rate_board_page", {"board": board, "columns": columns})
@@ -0,0 +1,7 @@
+# destination_worksessions is not stored anymore (resolved on the live worksession state):
+# its relation tables are not used and Odoo doesn't drop them
+def migrate(cr, version):
+    cr.execute("DROP TABLE IF EXISTS forexmanager_transfer_forexmanager_worksession_rel")
+    cr.execute("DROP TABLE IF EXISTS forexmanager_transfertransient_forexmanager_worksession_rel")
+    # The operation summaries are rendered from summary_data now, the stored HTML columns are left behind
+    cr.execute("ALTER TABLE forexmanager_operation DROP COLUMN IF EXISTS summary, DROP COLUMN IF EXISTS diff_calc_summary")
@@ -0,0 +1,29 @@
+# document_key (country, type and normalized number) becomes UNIQUE: the same document typed in
+# different ways ("pa 123<456", "PA123456") is merged into its oldest passport before the constraint
+# is created. The operations move to the kept passport, and the customers left without any passport
+# were the same person, so they are removed as the customer dedup merge does
+def migrate(cr, version):
+    cr.execute("""
+        CREATE TEMP TABLE forexmanager_passport_dup ON COMMIT DROP AS
+        SELECT id, customer_id, keep_id
+          FROM (SELECT p.id, p.customer_id,
+                       MIN(p.id) OVER (PARTITION BY c.code, p."ID_type",
+                                       UPPER(REGEXP_REPLACE(p."ID_number", '[[:space:]<.-]', '', 'g'))) AS keep_id
+                  FROM forexmanager_passport p
+                  JOIN res_country c ON c.id = p."ID_country"
+                 WHERE p."ID_type" IS NOT NULL
+                   AND REGEXP_REPLACE(COALESCE(p."ID_number", ''), '[[:space:]<.-]', '', 'g') <> '') AS doc
+         WHERE id <> keep_id
+    """)
+    cr.execute("""
+        UPDATE forexmanager_operation o
+           SET passport_id = d.keep_id
+          FROM forexmanager_passport_dup d
+         WHERE o.passport_id = d.id
+    """)
+    cr.execute("DELETE FROM forexmanager_passport p USING forexmanager_passport_dup d WHERE p.id = d.id")
+    cr.execute("""
+        DELETE FROM forexmanager_customer c
+         WHERE c.id IN (SELECT customer_id FROM forexmanager_passport_dup)
+           AND NOT EXISTS (SELECT 1 FROM forexmanager_passport p WHERE p.customer_id = c.id)
+    """)
@@ -1,12 +1,18 @@
 from . import currency
+from . import rate
+from . import rate_quote
 from . import calculation
 from . import operation
+from . import ocr_job
+from . import ocr_cache
 from . import breakdown
 from . import image
 from . import passport
 from . import customer
 from . import desk
 from . import cashcount
+from . import cashcount_move
+from . import cashcount_checkpoint
 from . import workcenter
 from . import checkbalance
 from . import user
@@ -1,4 +1,4 @@
-from odoo import fields, models, api
+from odoo import fields, models, api, tools
 from odoo.exceptions import ValidationError
 from ..utils import notification
 
@@ -62,6 +62,17 @@ class Breakdown(models.Model):
                             "warning")
                 break
 
+    # Accepted values for a currency (res.currency id) as a sorted, deduplicated tuple of cents.
+    # Cached until any breakdown is created, modified or deleted
+    @api.model
+    @tools.ormcache("currency_id")
+    def _get_denominations(self, currency_id):
+        breakdown_recs = self.sudo().search([
+            ("currency_real_id", "=", currency_id),
+            ("value", ">", 0)
+            ])
+        return tuple(sorted({int(round(value * 100)) for value in breakdown_recs.mapped("value")}))
+
     # vals here is a list of dictionaries
     def create(self, vals):
         for val in vals:
@@ -71,6 +82,7 @@ class Breakdown(models.Model):
                 raise ValidationError("No puedes crear un billete/moneda con un valor igual a 0.00 o inferior.")
 
         breakdown = super().create(vals)
+        self.env.registry.clear_cache() # Denominations changed
         
         for rec in breakdown:
             Breakdown.check_repeated_line(rec)
@@ -91,6 +103,8 @@ class Breakdown(models.Model):
                 raise ValidationError("No puedes crear un billete/moneda con un valor igual a 0.00 o inferior.")
             
         breakdown = super().write(vals)
+        if "value" in vals or "currency_id" in vals:
+            self.env.registry.clear_cache() # Denominations changed
 
         # Check for repeated_line
         if new_unit or new_value:
@@ -99,3 +113,8 @@ class Breakdown(models.Model):
                 raise ValidationError(f"Ya existe un desglose para {rec.name}. No puedes agregarlo nuevamente.")
                 
         return breakdown
+    
+    def unlink(self):
+        breakdown = super().unlink()
+        self.env.registry.clear_cache() # Denominations changed
+        return breakdown
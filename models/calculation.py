@@ -1,7 +1,10 @@
 from odoo import fields, models, api
 from odoo.exceptions import ValidationError
-from decimal import Decimal, ROUND_HALF_UP
-from ..utils import notification
+import logging
+from ..utils import notification, profiled_onchange, count_recompute
+from ..pricing import MARGIN, compute_rates, payable_pairs, to_cents
+
+_logger = logging.getLogger(__name__)
 
 
 class Calculation(models.Model):
@@ -10,7 +13,7 @@ class Calculation(models.Model):
     _name = "forexmanager.calculation"
     _description = "Cálculo para cambio de divisas"
 
-    MARGIN = 1.4 # Commercial margin over the base rate (official rate)
+    MARGIN = MARGIN # Commercial margin over the base rate (official rate). Defined in pricing.py
 
     # MAIN FIELDS
     currency_base_id = fields.Many2one("res.currency", default=125, readonly=True, required=True) # EUR by default
@@ -65,6 +68,8 @@ class Calculation(models.Model):
     buy_rate = fields.Float(compute="_compute_rate", store=True, digits=(16, 6))
     sell_rate = fields.Float(compute="_compute_rate", store=True, digits=(16, 6))
     worksession_id = fields.Many2one("forexmanager.worksession", related="operation_id.worksession_id", string="Sesión", store=True)
+    # Rates quoted for the whole operation (base_rate, buy_rate and sell_rate come from here)
+    quote_id = fields.Many2one("forexmanager.rate.quote", related="operation_id.quote_id", string="Cotización", store=True)
 
     # OTHER FIELDS
     # Relation with Operation
@@ -96,6 +101,13 @@ class Calculation(models.Model):
     up_down = fields.Char(store=False, readonly=True) # To know if user click on over_value or under_value
     available = fields.Boolean(default=True, store=False) # True if currency_balance > amount_delivered
     repeated_line = fields.Boolean(default=False, store=False) # To know if there is already a calculation line for these same currencies
+
+    # The same pair can't be saved twice in an operation, even with concurrent saves.
+    # Lines without operation_id (NULL) are never equal, so they don't count
+    _sql_constraints = [
+        ("pair_unique", "UNIQUE(operation_id, currency_source_id, currency_target_id)", 
+         "Ya existe una línea de cambio con las mismas divisas en esta operación. Modifique las cantidades de la línea que ya está creada."),
+    ]
      
 
     # Calculates if there is already a change line for these currencies in the same order.
@@ -104,19 +116,24 @@ class Calculation(models.Model):
     @api.onchange("source_currency_real_id", "target_currency_real_id")
     def _onchange_currencies_id(self):
         for rec in self:
+            rec.repeated_line = False
             if (rec.source_currency_real_id and rec.target_currency_real_id):
-                other_lines = [i for i in rec.operation_id.calculation_ids if i != rec]
-                
-                for i in other_lines:
-                    rec.repeated_line = False # Restart value from previous True
-                    if (i.source_currency_real_id == rec.source_currency_real_id) and (
-                        i.target_currency_real_id == rec.target_currency_real_id):
-                        rec.repeated_line = True
-                        notification(rec, "Ya existe un movimiento similar", 
-                                    f"Ya existe la línea de cambio {rec.source_currency_real_id.name} a {rec.target_currency_real_id.name}. \
-                                    No puedes agregarla nuevamente. Si prefieres, modifica las cantidades de la línea que ya está creada.",
-                                    "warning")
-                        break
+                rec.repeated_line = any(line != rec and line.currency_source_id == rec.currency_source_id
+                                        and line.currency_target_id == rec.currency_target_id
+                                        for line in rec.operation_id.calculation_ids)
+                if rec.repeated_line:
+                    notification(rec, "Ya existe un movimiento similar", 
+                                f"Ya existe la línea de cambio {rec.source_currency_real_id.name} a {rec.target_currency_real_id.name}. \
+                                No puedes agregarla nuevamente. Si prefieres, modifica las cantidades de la línea que ya está creada.",
+                                "warning")
+
+    # Profiling of the form (see Operation.onchange())
+    def onchange(self, values, field_names, fields_spec):
+        return profiled_onchange(self, _logger, super().onchange, values, field_names, fields_spec)
+
+    def _compute_field_value(self, field):
+        count_recompute(field)
+        return super()._compute_field_value(field)
 
     @api.depends("currency_source_id.unit_ids.image_ids")
     def _compute_images_ids(self):
@@ -135,101 +152,35 @@ class Calculation(models.Model):
             return rec.available
     
     # Auxiliar method called from aux_calc_amount_received() and aux_calc_amount_delivered()
-    def recalculate_amount(self, currency_id, amount, up_down):
-        # Recalculate having in consideration accepted bills and coins (in breakdown model)
-        amount = Decimal(str(amount)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-        breakdown_recs = self.env["forexmanager.breakdown"].search([
-            ("currency_real_id", "=", currency_id)
-        ])
-        bills = [Decimal(str(i.value)) for i in breakdown_recs if i.value > 0] if breakdown_recs else []
-        coins = [Decimal(str(i.value)) for i in breakdown_recs if i.value > 0] if breakdown_recs else []
-        if not bills and not coins:
+    def get_payable_pairs(self, typed):
+        # Nearest (amount_received, amount_delivered) pairs under and over the amount typed by the user ("received" or
+        # "delivered") that both currencies can pay with the accepted bills and coins (see pricing.nearest_payable_pairs)
+        self.ensure_one()
+        source_values = self.env["forexmanager.breakdown"]._get_denominations(self.source_currency_real_id.id)
+        target_values = self.env["forexmanager.breakdown"]._get_denominations(self.target_currency_real_id.id)
+        if not source_values or not target_values:
             raise ValidationError("No existe desglose de billetes ni monedas admitidos para una de las monedas seleccionadas. Consulte con su administrador de sistemas.")
-        values = bills + coins
 
-        remainders = []
-        for value in values:
-            remainder = (amount % value).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-            if remainder == 0:
-                return float(amount), False
-            else:
-                if up_down == "down":
-                    remainders.append(remainder)
-                elif up_down == "up":
-                    remainders.append(value - remainder)
-                else:
-                    raise ValidationError("Parámetro incorrecto. No se pudo completar el cálculo. " \
-                                            "Contacte con su equipo técnico para solucionarlo.")
-        
-        if up_down == "down":
-            new_amount = amount - min(remainders)
-        else:  # if "up"
-            new_amount = amount + min(remainders)
-        
-        return float(new_amount), True
+        cents = to_cents(self.amount_received if typed == "received" else self.amount_delivered)
+        return payable_pairs(typed, cents, source_values, target_values, self.buy_rate, self.sell_rate,
+                             self.source_currency_real_id == self.currency_base_id)
 
-    
     def aux_calc_amount_received(self):
         for rec in self:
-            def calculate(up_down):
-                # Recalculate amount_delivered and adjust it depending on the accepted bills and coins
-                amount_delivered, recalculated_delivered = rec.recalculate_amount(rec.target_currency_real_id, rec.amount_delivered, up_down)
-                # Calculate amount_received from amount_delivered
-                if rec.target_currency_real_id == rec.currency_base_id: # If clients buys base_currency
-                    amount_received = amount_delivered * rec.sell_rate
-                else: # If clients offers base_currency                    
-                    amount_received = amount_delivered / rec.buy_rate      
-                
-                # Recalculate amount_received and adjust it depending on the accepted bills and coins
-                amount_received, recalculated_received = rec.recalculate_amount(rec.source_currency_real_id, amount_received, up_down)
-                
-                while recalculated_received: # while amount_delivered is recalculated and readjusted
-                    # Calculate amount_delivered back from recalculated amount_received
-                    if rec.source_currency_real_id == rec.currency_base_id: # If clients offers base_currency
-                        amount_delivered = amount_received * rec.buy_rate
-                    else: # If clients buys base_currency
-                        amount_delivered = amount_received / rec.sell_rate
-                    
-                    # Recalculate amount_delivered and adjust it depending on the accepted bills and coins
-                    amount_delivered, recalculated_delivered = rec.recalculate_amount(
-                        rec.target_currency_real_id, amount_delivered, up_down
-                        )
-                    if not recalculated_delivered: # After recalculating the amount_received, if amount_delivered did not changed, break
-                        break
-                    
-                    # Calculate amount_received back from recalculated amount_delivered
-                    if rec.target_currency_real_id == rec.currency_base_id: # If clients buys base_currency
-                        amount_received = amount_delivered * rec.sell_rate
-                    else: # If clients offers base_currency                    
-                        amount_received = amount_delivered / rec.buy_rate       
-                    
-                    # Recalculate amount_received and adjust it depending of the accepted bills and coins
-                    amount_received, recalculated_received = rec.recalculate_amount(
-                        rec.source_currency_real_id, amount_received, up_down
-                        )
-                    
-                return round(amount_received, 2), round(amount_delivered, 2)
-            
-            if rec.up_down: # If has a value, means the user already click on the upper or under value of original amount
-                amount_received, amount_delivered = calculate(rec.up_down)
-            else:
-                amount_received, amount_delivered = calculate("down") # By default
+            pairs = rec.get_payable_pairs("delivered")
+            if not pairs:
+                continue
+            (received_under, delivered_under), (received_over, delivered_over) = pairs
 
             # Let's give an over_value and under_value of the initial amounts, depending in bills and coins accepted
             # for both currencies
-            if (rec.amount_delivered > 0 and rec.amount_delivered != amount_delivered):
-                amount_received, amount_delivered = calculate("up") # Let's check now "up"
-                if (rec.amount_delivered > 0 and rec.amount_delivered != amount_delivered):
-                    # Pair 1 (under)
-                    rec.received_amount_under, rec.delivered_amount_under = calculate("down")
-                    # Pair 2 (over)
-                    rec.received_amount_over, rec.delivered_amount_over = calculate("up")
-                else:
-                    rec.amount_received, rec.amount_delivered = amount_received, amount_delivered
-                    if not rec.check_availability(rec.currency_target_id, rec.amount_delivered):
-                        notification(rec, "No hay suficiente balance", "No existe suficiente balance de la divisa solicitada", "warning")
+            if delivered_under != to_cents(rec.amount_delivered):
+                # Pair 1 (under)
+                rec.received_amount_under, rec.delivered_amount_under = received_under / 100, delivered_under / 100
+                # Pair 2 (over)
+                rec.received_amount_over, rec.delivered_amount_over = received_over / 100, delivered_over / 100
             else:
-                rec.amount_received, rec.amount_delivered = amount_received, amount_delivered
+                rec.amount_received, rec.amount_delivered = received_under / 100, delivered_under / 100
                 if not rec.check_availability(rec.currency_target_id, rec.amount_delivered):
                     notification(rec, "No hay suficiente balance", "No existe suficiente balance de la divisa solicitada", "warning")
                              
@@ -263,60 +214,20 @@ class Calculation(models.Model):
 
     def aux_calc_amount_delivered(self):
         for rec in self:
-            def calculate(up_down):
-                # Recalculate amount_received and adjust it depending on the accepted bills and coins
-                amount_received, recalculated_received = rec.recalculate_amount(rec.source_currency_real_id, rec.amount_received, up_down)
-                
-                # Calculate amount_delivered from amount_received
-                if rec.source_currency_real_id == rec.currency_base_id: # If clients offers base_currency
-                    amount_delivered = amount_received * rec.buy_rate
-                else: # If clients buys base_currency
-                    amount_delivered = amount_received / rec.sell_rate
-
-                # Recalculate amount_delivered and adjust it depending on the accepted bills and coins
-                amount_delivered, recalculated_delivered = rec.recalculate_amount(rec.target_currency_real_id, amount_delivered, up_down)
-                
-                while recalculated_delivered: # while amount_delivered is recalculated and readjusted
-                    # Calculate amount_received back from recalculated amount_delivered
-                    if rec.target_currency_real_id == rec.currency_base_id: # If clients buys base_currency
-                        amount_received = amount_delivered * rec.sell_rate
-                    else: # If clients offers base_currency                    
-                        amount_received = amount_delivered / rec.buy_rate
-
-                    # Recalculate amount_received and adjust it depending on the accepted bills and coins
-                    amount_received, recalculated_received = rec.recalculate_amount(
-                        rec.source_currency_real_id, amount_received, up_down
-                        )                    
-                    if not recalculated_received: # After recalculating the amount_delivered, if amount_received did not changed, break
-                        break
-                    
-                    # Calculate amount_delivered back from recalculated amount_received
-                    if rec.source_currency_real_id == rec.currency_base_id:
-                        amount_delivered = amount_received * rec.buy_rate
-                    else:
-                        amount_delivered = amount_received / rec.sell_rate
-
-                    # Recalculate amount_delivered and adjust it depending of the accepted bills and coins
-                    amount_delivered, recalculated_delivered = rec.recalculate_amount(
-                        rec.target_currency_real_id, amount_delivered, up_down
-                        )
-                
-                return amount_received, amount_delivered
-            
-            if rec.up_down: # If has a value, means the user already click on the upper or under value of original amount
-                amount_received, amount_delivered = calculate(rec.up_down)
-            else:
-                amount_received, amount_delivered = calculate("down") # By default
+            pairs = rec.get_payable_pairs("received")
+            if not pairs:
+                continue
+            (received_under, delivered_under), (received_over, delivered_over) = pairs
 
             # Let's give an over_value and under_value of the initial amounts, depending in bills and coins accepted
             # for both currencies
-            if (rec.amount_received > 0 and rec.amount_received != amount_received):         
+            if received_under != to_cents(rec.amount_received):
                 # Pair 1 (under)
-                rec.received_amount_under, rec.delivered_amount_under = calculate("down")
+                rec.received_amount_under, rec.delivered_amount_under = received_under / 100, delivered_under / 100
                 # Pair 2 (over)
-                rec.received_amount_over, rec.delivered_amount_over = calculate("up")
+                rec.received_amount_over, rec.delivered_amount_over = received_over / 100, delivered_over / 100
             else:
-                rec.amount_received, rec.amount_delivered = amount_received, amount_delivered
+                rec.amount_received, rec.amount_delivered = received_under / 100, delivered_under / 100
 
                 if not rec.check_availability(rec.currency_target_id, rec.amount_delivered):
                     notification(rec, "No hay suficiente balance", "No existe suficiente balance de la divisa solicitada", "warning")       
@@ -369,7 +280,7 @@ class Calculation(models.Model):
             else:
                 rec.name = "Cálculo de cambio de moneda"
     
-    @api.depends("source_currency_real_id", "target_currency_real_id", "discount")
+    @api.depends("source_currency_real_id", "target_currency_real_id", "discount", "quote_id", "operation_id.quoted_at")
     def _compute_rate(self):
         for rec in self:
             if rec.source_currency_real_id and rec.target_currency_real_id:
@@ -384,24 +295,15 @@ class Calculation(models.Model):
                 # If currency_base is one of the two values, means is a single change
                 elif rec.source_currency_real_id == rec.currency_base_id or rec.target_currency_real_id == rec.currency_base_id:
                     if rec.source_currency_real_id != rec.currency_base_id:
-                        currency = self.env["forexmanager.currency"].search([
-                                ("currency_id", "=", rec.source_currency_real_id)
-                                ], limit=1)                        
+                        currency = rec.currency_source_id
                     elif rec.target_currency_real_id != rec.currency_base_id:
-                        currency = self.env["forexmanager.currency"].search([
-                                ("currency_id", "=", rec.target_currency_real_id)
-                                ], limit=1)                    
-                    rec.base_rate = currency.base_rate
+                        currency = rec.currency_target_id
+                    # Quoted rate for this operation (no new fetch): frozen in quote_id once saved, the one in force
+                    # when the form was opened before that. Lines without operation use the stored rate
+                    rec.base_rate = rec.quote_id.get_base_rate(currency) if rec.quote_id else \
+                                    self.env["forexmanager.rate.quote"].get_base_rate_at(currency, rec.operation_id.quoted_at)
                         
-                    sell_no_discount_rate = rec.base_rate * rec.MARGIN
-                    sell_difference = sell_no_discount_rate - currency.base_rate
-                    sell_add_to_base = sell_difference * ((100 - int(rec.discount)) / 100) # Discount is applied to difference between base and commercial rate
-                    rec.sell_rate = rec.base_rate + sell_add_to_base           
-
-                    buy_no_discount_rate = rec.base_rate / rec.MARGIN
-                    buy_difference = currency.base_rate - buy_no_discount_rate
-                    buy_substract_from_base = buy_difference * ((100 - int(rec.discount)) / 100) # Discount is applied to difference between base and commercial rate
-                    rec.buy_rate = rec.base_rate - buy_substract_from_base
+                    rec.buy_rate, rec.sell_rate = compute_rates(rec.base_rate, int(rec.discount), rec.MARGIN)
                 # If currency_base is NOT one of the two values, means is a double change (not allowed, must be done in 2 parts)
                 else:
                     rec.base_rate = False
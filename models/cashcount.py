@@ -1,5 +1,6 @@
 from odoo import fields, models, api
 from odoo.exceptions import ValidationError
+from collections import defaultdict
 
 
 class Cashcount(models.Model):
@@ -24,6 +25,129 @@ class Cashcount(models.Model):
             else:
                 rec.name = "Nuevo balance de moneda"
 
+    # Ledger API. Every balance change goes through here instead of reading and writing the float:
+    # deltas is {(desk_id, currency_id): signed amount}. The rows are locked (SELECT ... FOR UPDATE) always in
+    # the same order (desk, currency), so concurrent tellers/transfers wait for each other instead of losing updates
+    # or deadlocking. Every change is journaled in forexmanager.cashcount.move (origin is the record causing it).
+    # Returns {(desk_id, currency_id): new balance}
+    @api.model
+    def apply_deltas(self, deltas, error_message=None, origin=None):
+        return self.apply_moves([(key, amount, origin) for key, amount in deltas.items()], error_message)
+
+    # Same as apply_deltas() when the amounts come from several records: moves is a list of
+    # ((desk_id, currency_id), signed amount, origin record). Every row is still updated once (the amounts
+    # of the same desk/currency are added up), but every record gets its own journal move
+    @api.model
+    def apply_moves(self, moves, error_message=None):
+        moves = [(key, int(round(amount * 100)), origin) for key, amount, origin in moves]
+        deltas = defaultdict(int)
+        for key, cents, origin in moves:
+            deltas[key] += cents
+        cashcounts = self._lock_cashcounts([key for key, cents in deltas.items() if cents])
+        return self._post_moves(cashcounts, deltas, moves, error_message)
+
+    # Inventory adjustment (balance check): sets the counted amounts, journaling the difference as a move
+    @api.model
+    def set_balances(self, balances, origin=None):
+        cashcounts = self._lock_cashcounts(list(balances))
+        deltas = {key: int(round(balances[key] * 100)) - int(round(balance * 100)) 
+                  for key, (cashcount_id, balance) in cashcounts.items()}
+        return self._post_moves(cashcounts, deltas, [(key, cents, origin) for key, cents in deltas.items()], None)
+
+    def _lock_cashcounts(self, keys):
+        keys = sorted(keys)
+        if not keys:
+            return {}
+
+        self.flush_model(["balance"])
+        self.env.cr.execute("""
+            SELECT id, desk_id, currency_id, balance
+              FROM forexmanager_cashcount
+             WHERE (desk_id, currency_id) IN %s
+             ORDER BY desk_id, currency_id, id
+               FOR UPDATE
+            """, [tuple(keys)])
+        cashcounts = {}
+        for cashcount_id, desk_id, currency_id, balance in self.env.cr.fetchall():
+            cashcounts.setdefault((desk_id, currency_id), (cashcount_id, balance))
+
+        for key in keys:
+            if key not in cashcounts:
+                currency = self.env["forexmanager.currency"].browse(key[1])
+                raise ValidationError(f"No existe inventario creado para la moneda {currency.name}. Contacte con su administrador de sistemas.")
+        return cashcounts
+
+    def _post_moves(self, cashcounts, deltas, moves, error_message):
+        moved = {key: cashcounts[key] for key in cashcounts if deltas[key]}
+        balances = {key: balance for key, (cashcount_id, balance) in cashcounts.items()}
+        if not moved:
+            return balances
+
+        # One statement for every row (already locked). write_date/write_uid are kept as the ORM would
+        values = [(cashcount_id, deltas[key]) for key, (cashcount_id, balance) in moved.items()]
+        self.env.cr.execute("""
+            UPDATE forexmanager_cashcount c
+               SET balance = ROUND(c.balance::numeric + d.cents::numeric / 100, 2),
+                   write_date = NOW() AT TIME ZONE 'UTC',
+                   write_uid = %%s
+              FROM (VALUES %s) AS d(id, cents)
+             WHERE c.id = d.id
+         RETURNING c.id, c.balance
+            """ % ", ".join(["(%s, %s)"] * len(values)), [self.env.uid] + [value for row in values for value in row])
+        new_balances = dict(self.env.cr.fetchall())
+
+        for key, (cashcount_id, balance) in moved.items():
+            balances[key] = new_balances[cashcount_id]
+            if balances[key] < 0 and deltas[key] < 0: # The whole transaction is rolled back
+                currency = self.env["forexmanager.currency"].browse(key[1])
+                raise ValidationError(error_message or f"No hay saldo suficiente de {currency.name} en la ventanilla para realizar este movimiento.")
+
+        # One journal move per origin (they add up to the change of the row)
+        vals_list = [{
+            "desk_id": key[0],
+            "currency_id": key[1],
+            "delta_cents": cents,
+            "res_model": origin._name if origin else False,
+            "res_id": origin.id if origin else False,
+            } for key, cents, origin in moves if cents and key in moved]
+
+        self.env["forexmanager.cashcount.move"].sudo().create(vals_list)
+        self.browse([cashcount_id for cashcount_id, balance in cashcounts.values()]).invalidate_recordset(["balance", "write_date", "write_uid"])
+        return balances
+
+    # Balance of every currency of a desk at a past moment: last checkpoint before it plus the tail of the journal
+    @api.model
+    def balance_at(self, desk_id, at=None):
+        at = at or fields.Datetime.now()
+        self.env.cr.execute("""
+            WITH checkpoint AS (
+                SELECT DISTINCT ON (currency_id) currency_id, balance_cents, move_id
+                  FROM forexmanager_cashcount_checkpoint
+                 WHERE desk_id = %(desk_id)s AND date <= %(at)s
+                 ORDER BY currency_id, date DESC, move_id DESC
+            ), tail AS (
+                SELECT m.currency_id, SUM(m.delta_cents) AS delta_cents
+                  FROM forexmanager_cashcount_move m
+                  LEFT JOIN checkpoint c ON c.currency_id = m.currency_id
+                 WHERE m.desk_id = %(desk_id)s AND m.id > COALESCE(c.move_id, 0) AND m.date <= %(at)s
+                 GROUP BY m.currency_id
+            )
+            SELECT COALESCE(c.currency_id, t.currency_id), COALESCE(c.balance_cents, 0) + COALESCE(t.delta_cents, 0)
+              FROM checkpoint c
+              FULL JOIN tail t ON t.currency_id = c.currency_id
+            """, {"desk_id": desk_id, "at": at})
+        return {currency_id: float(cents) / 100 for currency_id, cents in self.env.cr.fetchall()}
+
+    def write(self, vals):
+        # Manual balance edits (admins) are journaled as adjustments too
+        if "balance" in vals:
+            vals = dict(vals)
+            balance = vals.pop("balance")
+            self.set_balances({(rec.desk_id.id, rec.currency_id.id): balance for rec in self})
+            if not vals:
+                return True
+        return super().write(vals)
+
     def unlink(self):
         for rec in self:
             # Check if the cashcount for this desk is greater than 0 and avoid deletion
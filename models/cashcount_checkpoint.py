@@ -0,0 +1,51 @@
+from odoo import fields, models, api
+
+
+class CashcountCheckpoint(models.Model):
+    """A model for saving the balance of a desk/currency up to a cash movement, so past balances don't need the whole journal."""
+
+    _name = "forexmanager.cashcount.checkpoint"
+    _description = "Punto de control de caja"
+    _order = "move_id desc"
+
+    # MAIN FIELDS
+    desk_id = fields.Many2one("forexmanager.desk", string="Ventanilla", required=True, readonly=True)
+    currency_id = fields.Many2one("forexmanager.currency", string="Divisa", required=True, readonly=True)
+    balance_cents = fields.Float(string="Balance (céntimos)", digits=(20, 0), required=True, readonly=True)
+    # Last move included in balance_cents (moves are journaled in id order)
+    move_id = fields.Many2one("forexmanager.cashcount.move", string="Último movimiento", required=True, readonly=True)
+    date = fields.Datetime(string="Fecha", required=True, readonly=True)
+
+
+    def init(self):
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS forexmanager_cashcount_checkpoint_lookup_idx
+                ON forexmanager_cashcount_checkpoint (desk_id, currency_id, date DESC, move_id DESC)
+            """)
+
+    # Called from the scheduled action. Only the moves after the previous checkpoint are added up
+    @api.model
+    def _cron_create_checkpoints(self):
+        # Waits for the ledger: no move can be half journaled while the cashcounts are locked
+        self.env.cr.execute("SELECT id FROM forexmanager_cashcount ORDER BY desk_id, currency_id, id FOR UPDATE")
+        self.env.cr.execute("""
+            WITH last AS (
+                SELECT DISTINCT ON (desk_id, currency_id) desk_id, currency_id, balance_cents, move_id
+                  FROM forexmanager_cashcount_checkpoint
+                 ORDER BY desk_id, currency_id, move_id DESC
+            )
+            SELECT m.desk_id, m.currency_id, COALESCE(l.balance_cents, 0) + SUM(m.delta_cents), MAX(m.id), MAX(m.date)
+              FROM forexmanager_cashcount_move m
+              LEFT JOIN last l ON l.desk_id = m.desk_id AND l.currency_id = m.currency_id
+             WHERE m.id > COALESCE(l.move_id, 0)
+             GROUP BY m.desk_id, m.currency_id, l.balance_cents
+            """)
+        vals_list = [{
+            "desk_id": desk_id,
+            "currency_id": currency_id,
+            "balance_cents": balance_cents,
+            "move_id": move_id,
+            "date": date,
+            } for desk_id, currency_id, balance_cents, move_id, date in self.env.cr.fetchall()]
+        if vals_list:
+            self.sudo().create(vals_list)
@@ -0,0 +1,51 @@
+from odoo import fields, models, api
+from odoo.exceptions import ValidationError
+
+
+class CashcountMove(models.Model):
+    """A model for journaling every change in the cashcount balances (append-only). Records are created from the cashcount ledger."""
+
+    _name = "forexmanager.cashcount.move"
+    _description = "Movimiento de caja"
+    _order = "id desc"
+
+    # MAIN FIELDS
+    desk_id = fields.Many2one("forexmanager.desk", string="Ventanilla", required=True, readonly=True)
+    currency_id = fields.Many2one("forexmanager.currency", string="Divisa", required=True, readonly=True)
+    # Signed amount in minor units (cents), stored as numeric so it is exact
+    delta_cents = fields.Float(string="Movimiento (céntimos)", digits=(20, 0), required=True, readonly=True)
+    amount = fields.Float(compute="_compute_amount", string="Movimiento")
+    date = fields.Datetime(string="Fecha", default=fields.Datetime.now, required=True, readonly=True, index=True)
+    # Record that caused the movement (operation, transfer line, checkbalance...)
+    res_model = fields.Char(string="Origen", readonly=True)
+    res_id = fields.Many2oneReference(string="ID de origen", model_field="res_model", readonly=True)
+
+
+    def init(self):
+        # Tail of the journal for a desk/currency after a checkpoint
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS forexmanager_cashcount_move_tail_idx
+                ON forexmanager_cashcount_move (desk_id, currency_id, id)
+            """)
+        # Balances existing before the journal was introduced are recorded as one opening move
+        self.env.cr.execute("""
+            INSERT INTO forexmanager_cashcount_move (desk_id, currency_id, delta_cents, date, res_model, res_id,
+                                                     create_date, write_date)
+            SELECT c.desk_id, c.currency_id, ROUND(c.balance::numeric * 100), NOW() AT TIME ZONE 'UTC',
+                   'forexmanager.cashcount', c.id, NOW() AT TIME ZONE 'UTC', NOW() AT TIME ZONE 'UTC'
+              FROM forexmanager_cashcount c
+             WHERE c.balance <> 0
+               AND NOT EXISTS (SELECT 1 FROM forexmanager_cashcount_move m
+                                WHERE m.desk_id = c.desk_id AND m.currency_id = c.currency_id)
+            """)
+
+    @api.depends("delta_cents")
+    def _compute_amount(self):
+        for rec in self:
+            rec.amount = rec.delta_cents / 100
+
+    def write(self, vals):
+        raise ValidationError("Los movimientos de caja no se pueden modificar.")
+
+    def unlink(self):
+        raise ValidationError("Los movimientos de caja no se pueden eliminar.")
@@ -1,7 +1,6 @@
 from odoo import fields, models, api
 from odoo.exceptions import ValidationError
 from decimal import Decimal, ROUND_HALF_UP
-from ..utils import get_base_rate
 
 
 class CheckBalance(models.Model):
@@ -32,9 +31,9 @@ class CheckBalance(models.Model):
     def _compute_value(self):
         for rec in self:
             if rec.saved_difference and rec.currency_id:
-                base_rate = Decimal(get_base_rate(
-                                            from_currency=rec.currency_id.initials, 
-                                            to_currency=rec.currency_id.currency_base_id.name)).quantize(
+                base_rate = Decimal(self.env["forexmanager.rate"].get_rate(
+                                            rec.currency_id.initials, 
+                                            rec.currency_id.currency_base_id.name)).quantize(
                                                                                             Decimal("0.01"), rounding=ROUND_HALF_UP
                                     ) if rec.currency_id.initials != rec.currency_id.currency_base_id.name else 1
                 rec.value = float(Decimal(Decimal(rec.saved_difference) * base_rate).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
@@ -1,6 +1,7 @@
-from odoo import fields, models, api
+from odoo import fields, models, api, tools
 from odoo.exceptions import ValidationError
-from ..utils import get_base_rate, notification, create_initial_inventories
+from ..utils import notification, create_initial_inventories
+from ..pricing import MARGIN, rate_board
 
 
 class Currency(models.Model):
@@ -16,7 +17,8 @@ class Currency(models.Model):
     initials = fields.Char(related="currency_id.name", readonly=True, store=True, string="Iniciales")
     symbol = fields.Char(related="currency_id.symbol", readonly=True, store=True, string="Símbolo")
     short_name = fields.Char(related="currency_id.full_name", readonly=True, store=True, string="Nombre")
-    base_rate = fields.Float(compute="_compute_base_rate") # currency_id related to currency_base_id
+    base_rate = fields.Float(compute="_compute_base_rate", store=True, digits=(16, 6)) # currency_id related to currency_base_id
+    rate_id = fields.Many2one("forexmanager.rate", string="Último tipo de cambio", readonly=True) # Updated by the scheduled rate refresh
 
     # OTHER FIELDS
     # Units_ids is mandatory in create() and write()
@@ -37,18 +39,49 @@ class Currency(models.Model):
             else:
                 rec.name = "Nueva divisa"
     
-    @api.depends("currency_id")
+    @api.depends("currency_id", "rate_id.rate")
     def _compute_base_rate(self):
-        # Some currencies are not suported by the current api
+        # Some currencies are not suported by the current api.
+        # Rate comes from the latest snapshot (forexmanager.rate). Never fetched here (this also runs on module
+        # update, with no network guaranteed): if there is no snapshot yet (new currency), it's 0 until the
+        # scheduled refresh links one
         for rec in self:
             if rec.currency_id:
                 if rec.currency_id != rec.currency_base_id:
-                    rec.base_rate = get_base_rate(from_currency=rec.currency_base_id.name, to_currency=rec.currency_id.name)
+                    rate = rec.rate_id or self.env["forexmanager.rate"]._get_latest_rate(rec.currency_base_id.id, rec.currency_id.id)
+                    rec.base_rate = rate.rate if rate else 0
                 else:
                     rec.base_rate = 1
             else:
                 rec.base_rate = 0
 
+    # Buy/sell rates of every currency at every discount level, for the rate board screens.
+    # Cached until the next rate refresh (new snapshot version) or a currency is added or removed
+    @api.model
+    def get_rate_board(self):
+        latest = self.env["forexmanager.rate"].sudo().search([], order="version desc", limit=1)
+        return self._get_rate_board(latest.version or 0, tuple(self.sudo().search([]).ids))
+
+    @api.model
+    @tools.ormcache("version", "currency_ids")
+    def _get_rate_board(self, version, currency_ids):
+        currencies = self.sudo().browse(currency_ids).filtered(lambda c: c.currency_id != c.currency_base_id)
+        discounts = [int(d) for d, _ in self.env["forexmanager.calculation"]._fields["discount"].selection]
+        buy, sell = rate_board(currencies.mapped("base_rate"), discounts, MARGIN)
+
+        return {
+            "version": version,
+            "base": currencies[:1].currency_base_id.name or "",
+            "discounts": discounts,
+            "rows": [{
+                "currency": currency.name,
+                "initials": currency.initials,
+                "base_rate": currency.base_rate,
+                "buy": [round(rate, 6) for rate in buy[i]],
+                "sell": [round(rate, 6) for rate in sell[i]],
+                } for i, currency in enumerate(currencies)],
+            }
+
     def create(self, vals):
         currency = super().create(vals)
         if not currency.unit_ids:
@@ -58,6 +91,12 @@ class Currency(models.Model):
                     "Recuerda luego asignar al menos un centro de trabajo a esta divisa. Ve a CONFIGURACIÓN/ADMINISTRAR CENTROS DE TRABAJO", 
                     "warning")
 
+        # No rate yet: run the rate refresh now instead of waiting for the next scheduled one
+        if not currency.base_rate:
+            cron = self.env.ref("forexmanager.ir_cron_forexmanager_refresh_rates", raise_if_not_found=False)
+            if cron:
+                cron.sudo()._trigger()
+
         # Add the new currency to every desk cashcount (inventory) for every desk in workcenter_ids
         desk_ids = currency.workcenter_ids.desk_ids
         if desk_ids:
@@ -1,4 +1,7 @@
 from odoo import fields, models, api
+from collections import defaultdict
+from difflib import SequenceMatcher
+import unicodedata
 
 
 class Customer(models.Model):
@@ -8,6 +11,9 @@ class Customer(models.Model):
     _name = "forexmanager.customer"
     _description = "Cliente"
 
+    NAME_SIMILARITY = 0.9 # Minimum similarity (0-1) of first_name_1 + last_name_1 for merging two customers with the same document number
+    DEDUP_BATCH = 1000 # New customers checked per batch
+
     # MAIN FIELDS
     # Customer data
     name = fields.Char(string="Nombre completo", compute="_compute_name", store=True)
@@ -43,4 +49,65 @@ class Customer(models.Model):
             if rec.first_name_1 and rec.last_name_1:
                 rec.name = f"{rec.first_name_1} {rec.first_name_2 if rec.first_name_2 else ''} {rec.last_name_1} {rec.last_name_2 if rec.last_name_2 else ''}"
             else:
-                rec.name = "Nuevo cliente"
\ No newline at end of file
+                rec.name = "Nuevo cliente"
+
+    # Auxiliar method: name used for comparing customers (no accents, uppercase, single spaces)
+    @staticmethod
+    def match_name(first_name, last_name):
+        name = unicodedata.normalize("NFKD", f"{first_name or ''} {last_name or ''}")
+        return " ".join("".join(c for c in name if not unicodedata.combining(c)).upper().split())
+
+    # Called from the scheduled action. Only the customers created since the last run are checked, one batch per call
+    # (the cron runs again while there are customers left). A merge can't be undone, so a new customer is only merged
+    # into an older one holding the same document number (normalized, whatever its country or type) with the same
+    # birth date and a similar name: the document number, not the name, says that they are the same person
+    @api.model
+    def _cron_merge_duplicates(self):
+        params = self.env["ir.config_parameter"].sudo()
+        last_id = int(params.get_param("forexmanager.customer_dedup_last_id", 0))
+        Customer = self.sudo()
+
+        new_customers = Customer.search([("id", ">", last_id)], order="id", limit=self.DEDUP_BATCH)
+        if not new_customers:
+            return
+
+        # Candidates of the whole batch in one query, grouped by (birth_date, document number)
+        passports = self.env["forexmanager.passport"].sudo().search([
+            ("ID_number_normalized", "in", [number for number in set(new_customers.passport_ids.mapped("ID_number_normalized")) if number]),
+            ("customer_id", "<=", new_customers[-1].id),
+            ], order="customer_id")
+        blocks = defaultdict(list)
+        for passport in passports:
+            blocks[(passport.customer_id.birth_date, passport.ID_number_normalized)].append(passport.customer_id)
+
+        merged = set()
+        for customer in new_customers:
+            name = Customer.match_name(customer.first_name_1, customer.last_name_1)
+            for number in set(customer.passport_ids.mapped("ID_number_normalized")):
+                master = next((
+                    other for other in blocks[(customer.birth_date, number)]
+                    if other.id < customer.id and other.id not in merged
+                    and SequenceMatcher(None, name, Customer.match_name(other.first_name_1, other.last_name_1)).ratio() >= self.NAME_SIMILARITY
+                    ), None)
+                if master:
+                    customer._merge_into(master)
+                    merged.add(customer.id)
+                    break
+
+        params.set_param("forexmanager.customer_dedup_last_id", new_customers[-1].id)
+        self.env["ir.cron"]._notify_progress(done=len(new_customers),
+                                             remaining=Customer.search_count([("id", ">", new_customers[-1].id)]))
+
+    # Moves the passports (and the operations made with them) of this customer to master, then deletes it
+    def _merge_into(self, master):
+        self.ensure_one()
+        master_passports = {passport.document_key: passport for passport in master.passport_ids if passport.document_key}
+        operations = self.env["forexmanager.operation"].sudo()
+        for passport in self.passport_ids:
+            same = master_passports.get(passport.document_key)
+            if same: # Same document registered twice: keep master's one
+                operations.search([("passport_id", "=", passport.id)]).write({"passport_id": same.id})
+                passport.unlink()
+            else:
+                passport.customer_id = master
+        self.unlink()
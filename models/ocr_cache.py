@@ -0,0 +1,49 @@
+from odoo import fields, models, api
+import json
+
+
+class OCRCache(models.Model):
+    """A model for keeping the MRZ already read from a document image (keyed by the SHA-256 of the image)."""
+
+    _name = "forexmanager.ocr.cache"
+    _description = "Caché de lecturas de documentos"
+    _order = "last_used desc"
+
+    CACHE_SIZE = 5000 # Entries kept. The least recently used are deleted
+
+    # MAIN FIELDS
+    checksum = fields.Char(string="Huella", required=True, readonly=True)
+    mrz_data = fields.Json(string="MRZ", readonly=True)
+    valid_score = fields.Integer(string="Fiabilidad", readonly=True)
+    last_used = fields.Datetime(string="Último uso", default=fields.Datetime.now, readonly=True, index=True)
+
+    _sql_constraints = [
+        ("checksum_unique", "UNIQUE(checksum)", "Ya existe una lectura guardada para esta imagen."),
+    ]
+
+
+    # Returns the cached MRZ dict for this image checksum, or None
+    @api.model
+    def lookup(self, checksum):
+        entry = self.sudo().search([("checksum", "=", checksum)], limit=1)
+        if not entry:
+            return None
+        entry.last_used = fields.Datetime.now()
+        return entry.mrz_data
+
+    @api.model
+    def store(self, checksum, mrz_dict):
+        self.env.cr.execute("""
+            INSERT INTO forexmanager_ocr_cache (checksum, mrz_data, valid_score, last_used, create_uid, create_date, write_uid, write_date)
+            VALUES (%s, %s, %s, NOW() AT TIME ZONE 'UTC', %s, NOW() AT TIME ZONE 'UTC', %s, NOW() AT TIME ZONE 'UTC')
+            ON CONFLICT (checksum) DO UPDATE SET mrz_data = EXCLUDED.mrz_data, valid_score = EXCLUDED.valid_score,
+                                                 last_used = EXCLUDED.last_used
+            """, [checksum, json.dumps(mrz_dict), mrz_dict.get("valid_score", 0), self.env.uid, self.env.uid])
+        self._evict()
+        self.invalidate_model()
+
+    def _evict(self):
+        self.env.cr.execute("""
+            DELETE FROM forexmanager_ocr_cache
+             WHERE id IN (SELECT id FROM forexmanager_ocr_cache ORDER BY last_used DESC, id DESC OFFSET %s)
+            """, [self.CACHE_SIZE])
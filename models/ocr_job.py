@@ -0,0 +1,144 @@
+from odoo import fields, models, api, SUPERUSER_ID
+from odoo.modules.registry import Registry
+from odoo.tools import config
+from datetime import timedelta
+from functools import partial
+import base64
+import hashlib
+import logging
+from ..ocr import get_pool, OCR_TIMEOUT
+from ..utils import notification
+
+_logger = logging.getLogger(__name__)
+
+
+class OCRJob(models.Model):
+    """A model for queueing the reading of identity documents (MRZ), so it never runs inside an HTTP worker."""
+
+    _name = "forexmanager.ocr.job"
+    _description = "Lectura de documento"
+    _order = "id desc"
+
+    JOB_TIMEOUT = 5 # Minutes before a pending job is taken over by the scheduled action
+    JOB_RETENTION = 1 # Days a job is kept
+
+    # MAIN FIELDS
+    user_id = fields.Many2one("res.users", string="Empleado", default=lambda self: self.env.uid, readonly=True)
+    state = fields.Selection([
+        ("pending", "Pendiente"),
+        ("done", "Leído"),
+        ("failed", "Error")
+        ], string="Estado", default="pending", required=True, readonly=True)
+    image = fields.Binary(string="Imagen", attachment=True, readonly=True)
+    checksum = fields.Char(string="Huella", readonly=True, index=True) # SHA-256 of the decoded image
+    mrz_data = fields.Json(string="MRZ", readonly=True)
+    valid_score = fields.Integer(string="Fiabilidad", readonly=True)
+    error = fields.Char(string="Error", readonly=True)
+
+
+    @api.model
+    def _get_workers(self):
+        # Helper processes per Odoo worker (forexmanager_ocr_workers in the Odoo config file). With 0, only the cron reads
+        return int(config.get("forexmanager_ocr_workers", 2))
+
+    @api.model
+    def checksum_of(self, image):
+        return hashlib.sha256(base64.b64decode(image)).hexdigest()
+
+    # Called from the operation form when image_1 is uploaded. The reading starts once the job is committed.
+    # An image already read (same SHA-256) is taken from forexmanager.ocr.cache, with no OCR at all
+    @api.model
+    def enqueue(self, image):
+        checksum = self.checksum_of(image)
+        job = self.sudo().search([
+            ("checksum", "=", checksum),
+            ("state", "=", "pending"),
+            ], limit=1)
+        if job: # Same image uploaded again while it's being read
+            return job
+
+        mrz_dict = self.env["forexmanager.ocr.cache"].lookup(checksum)
+        if mrz_dict:
+            return self.sudo().create({
+                "checksum": checksum,
+                "user_id": self.env.uid,
+                "state": "done",
+                "mrz_data": mrz_dict,
+                "valid_score": mrz_dict.get("valid_score", 0),
+                })
+
+        job = self.sudo().create({
+            "image": image,
+            "checksum": checksum,
+            "user_id": self.env.uid,
+            })
+        if self._get_workers():
+            self.env.cr.postcommit.add(partial(job._submit, base64.b64decode(image)))
+        return job
+
+    def _submit(self, image_bytes):
+        future = get_pool(self._get_workers()).submit(image_bytes)
+        future.add_done_callback(partial(OCRJob._job_done, self.env.cr.dbname, self.id))
+
+    # Runs in the pool thread: its own cursor, since the request that enqueued the job is already finished
+    @staticmethod
+    def _job_done(dbname, job_id, future):
+        try:
+            mrz_dict = future.result()
+        except Exception as e:
+            mrz_dict = None
+            _logger.warning("Document reading job %s failed: %s", job_id, e)
+        
+        try:
+            with Registry(dbname).cursor() as cr:
+                env = api.Environment(cr, SUPERUSER_ID, {})
+                job = env["forexmanager.ocr.job"].browse(job_id).exists()
+                if job and job.state == "pending":
+                    job._set_result(mrz_dict)
+        except Exception:
+            _logger.exception("Could not save the result of document reading job %s", job_id)
+
+    def _set_result(self, mrz_dict):
+        self.ensure_one()
+        if mrz_dict:
+            self.write({
+                "state": "done",
+                "mrz_data": mrz_dict,
+                "valid_score": mrz_dict.get("valid_score", 0),
+                "image": False, # Not needed anymore
+                })
+            self.env["forexmanager.ocr.cache"].store(self.checksum, mrz_dict)
+            notification(self.with_user(self.user_id), "Documento leído",
+                         "Ya puede marcar la opción 'Leer datos' para rellenar los datos del cliente.",
+                         "info")
+        else:
+            self.write({
+                "state": "failed",
+                "error": "No se encontró la zona MRZ en la imagen.",
+                })
+            notification(self.with_user(self.user_id), "No se pudo leer el documento",
+                         "Por favor, rellene los datos manualmente.",
+                         "warning")
+
+    # Called from the scheduled action. Reads the jobs left pending (no helper processes or a lost worker)
+    @api.model
+    def _cron_process_pending(self):
+        jobs = self.sudo().search([
+            ("state", "=", "pending"),
+            ("create_date", "<", fields.Datetime.now() - timedelta(minutes=self.JOB_TIMEOUT if self._get_workers() else 0)),
+            ], order="id")
+        pool = get_pool(max(self._get_workers(), 1))
+        for job in jobs:
+            try:
+                mrz_dict = pool.submit(base64.b64decode(job.image)).result(timeout=OCR_TIMEOUT)
+            except Exception as e:
+                mrz_dict = None
+                _logger.warning("Document reading job %s failed: %s", job.id, e)
+            job._set_result(mrz_dict)
+            self.env.cr.commit()
+
+    @api.autovacuum
+    def _gc_old_jobs(self):
+        self.sudo().search([
+            ("create_date", "<", fields.Datetime.now() - timedelta(days=self.JOB_RETENTION)),
+            ]).unlink()
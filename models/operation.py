@@ -1,11 +1,13 @@
-from odoo import fields, models, api
+from odoo import Command, fields, models, api
 from odoo.exceptions import ValidationError
-from passporteye import read_mrz
-import base64
+from collections import defaultdict
 from datetime import datetime
-from decimal import Decimal, ROUND_HALF_UP
-from io import BytesIO
-from ..utils import notification
+import logging
+from ..ocr import MIN_VALID_SCORE
+from ..pricing import summarize
+from ..utils import notification, profiled_onchange, count_recompute, mrz_country_code
+
+_logger = logging.getLogger(__name__)
 
 
 class Operation(models.Model):
@@ -22,6 +24,10 @@ class Operation(models.Model):
                               default=lambda self: self.env.user.current_desk_id.id)
     worksession_id = fields.Many2one("forexmanager.worksession", compute="_compute_worksession_id", store=True, string="Sesión", readonly=True)
     opening_desk_id = fields.Many2one(related="worksession_id.opening_desk_id", string="Ventanilla de apertura", store=True, readonly=True)
+    # Rates offered to the customer: the ones in force when the form was opened (quoted_at). Every calculation line
+    # is priced against them, and they are frozen in quote_id when the operation is saved
+    quoted_at = fields.Datetime(string="Hora de cotización", readonly=True, copy=False, default=fields.Datetime.now)
+    quote_id = fields.Many2one("forexmanager.rate.quote", string="Cotización", readonly=True, copy=False)
 
     # Customer data
     first_name_1 = fields.Char(string="Primer nombre", required=True)
@@ -61,12 +67,16 @@ class Operation(models.Model):
     image_2 = fields.Image(string="Imagen 2")
     image_3 = fields.Image(string="Imagen 3")
     image_4 = fields.Image(string="Imagen 4")
+    # Background reading (MRZ) of image_1, enqueued when the image is uploaded
+    ocr_job_id = fields.Many2one("forexmanager.ocr.job", string="Lectura de documento", readonly=True, copy=False, ondelete="set null")
     # Storing this field to know if the info was taken from DB or current document read.
     # In case first time the info was wrongly taken, we know which user made the mistake.
     data_from_db = fields.Boolean(string="Datos del cliente encontrados en la BBDD", default=False)
-    # HTML fields for showing in the form view
-    summary = fields.Html(string="Movimientos", options="{'sanitize': False}", compute="_onchange_summary_tables", store=True)
-    diff_calc_summary = fields.Html(string="Resumen", options="{'sanitize': False}", store=True)
+    # Totals per currency ({"receive": {...}, "deliver": {...}, "diff": {...}}, see pricing.summarize()). Only these are stored
+    summary_data = fields.Json(string="Totales", compute="_compute_summary_data", store=True)
+    # HTML fields for showing in the form view (rendered from summary_data with QWeb templates, not stored)
+    summary = fields.Html(string="Movimientos", compute="_compute_summary_html", sanitize=False)
+    diff_calc_summary = fields.Html(string="Resumen", compute="_compute_summary_html", sanitize=False)
 
     # OTHER FIELDS
     closing_session_check_started = fields.Boolean(related="worksession_id.closing_session.balances_checked_started")
@@ -83,213 +93,81 @@ class Operation(models.Model):
     def _onchange_transfertransient_ids(self):
         # Deletes the transfer if not transfer_line
         for rec in self:
-            # Filter transfers with transfer_lines
+            # Filter transfers with transfer_lines. They are sent when the operation is saved (see create())
             rec.transfertransient_ids = rec.transfertransient_ids.filtered(lambda t: t.transfer_line_ids)
 
-            # Create the transfer (Transfer model) and its transfer lines (TransferLine model)
-            for t in rec.transfertransient_ids:
-                for t_line in t.transfer_line_ids:
-                    def get_opening_desk_worksession_id():
-                        # Get opening_desk_id for current user
-                        user_id = self.env.user
-                        opening_desk_id = user_id.opening_desk_id
-                        
-                        opening_desk_worksession_id = self.env["forexmanager.worksession"].search([
-                            ("desk_id", "=", opening_desk_id.id),
-                            ("user_id", "=", user_id.id),
-                            ("session_status", "=", "open"),
-                            ("session_type", "=", "checkin")
-                            ], limit=1)
-                        
-                        return opening_desk_worksession_id.id if opening_desk_worksession_id else None
-
-                    self.env['forexmanager.transfer'].create({
-                        "worksession_id": rec.worksession_id.id,
-                        "opening_desk_worksession_id": get_opening_desk_worksession_id(),
-                        "transfer_line_ids": [[
-                            0, 'temp', {
-                                'receiver_desk_id': t_line.receiver_desk_id.id, 
-                                'currency_id': t_line.currency_id.id, 
-                                'amount': t_line.amount,
-                                }
-                            ]]
-                        })
-            
-            # Delete the temporal record (TransferTransient model) from the one2many in Operation form view
-            rec.transfertransient_ids = False            
+    # Lines of the transfers filled in the form, from the commands of transfertransient_ids.
+    # The transient transfers are never stored: the real ones are created from these lines
+    @api.model
+    def _transient_transfer_lines(self, commands):
+        return [{
+            "receiver_desk_id": line_command[2]["receiver_desk_id"],
+            "currency_id": line_command[2]["currency_id"],
+            "amount": line_command[2]["amount"],
+            } for command in commands or [] if command[0] == Command.CREATE
+              for line_command in command[2].get("transfer_line_ids") or [] if line_command[0] == Command.CREATE]
+
+    # Creates the transfers (Transfer model) and their transfer lines (TransferLine model): all the lines at once,
+    # one transfer per receiver desk
+    def _send_transfer_lines(self, line_vals):
+        self.ensure_one()
+        if not line_vals:
+            return
+        user_id = self.env.user
+        opening_desk_worksession_id = self.env["forexmanager.worksession"].get_open_session(user_id.id, user_id.opening_desk_id.id) \
+                                      if user_id.opening_desk_id else self.env["forexmanager.worksession"]
+        self.env["forexmanager.transfer"].send_lines(line_vals, self.worksession_id.id, opening_desk_worksession_id.id or None)
     
     @api.onchange("calculation_ids")
     def _onchange_summary_tables(self):
         for rec in self:
-            # Avoid adding a repeated line or a line with no availability or a line with amount <= 0
-            rec.calculation_ids = rec.calculation_ids.filtered(lambda l: l.available)
-            rec.calculation_ids = rec.calculation_ids.filtered(lambda l: not l.repeated_line)
-            rec.calculation_ids = rec.calculation_ids.filtered(lambda l: l.amount_received > 0)
-            rec.calculation_ids = rec.calculation_ids.filtered(lambda l: l.amount_delivered > 0)
-
-            receive_summary = {} # {currency: amount}
-            deliver_summary = {} # {currency: amount}
-            diff_calc_summary = {} # {currency: {"receive": amount, "deliver": amount}}
-
-            # Grouping the amounts for every currency
-            for line in rec.calculation_ids:
-                # Convert to Decimal
-                amount_received = Decimal(str(line.amount_received or 0))
-                amount_delivered = Decimal(str(line.amount_delivered or 0))
-
-                # Group by amount
-                receive_summary.setdefault(line.currency_source_id.name, Decimal('0'))
-                receive_summary[line.currency_source_id.name] += amount_received
-
-                deliver_summary.setdefault(line.currency_target_id.name, Decimal('0'))
-                deliver_summary[line.currency_target_id.name] += amount_delivered
-
-            # Calculating difference if currency is in both tables (receive and deliver)
-            for currency, amount in receive_summary.items():
-                diff_calc_summary.setdefault(currency, {"receive": 0, "deliver": 0})
-                
-                if currency not in deliver_summary:
-                    diff_calc_summary[currency]["receive"] = amount
-                else: 
-                    if receive_summary[currency] > deliver_summary[currency]:
-                        diff_calc_summary[currency]["receive"] = receive_summary[currency] - deliver_summary[currency]
-                    elif receive_summary[currency] < deliver_summary[currency]:
-                        diff_calc_summary[currency]["deliver"] = deliver_summary[currency] - receive_summary[currency]
-            for currency, amount in deliver_summary.items():
-                if currency not in receive_summary:
-                    diff_calc_summary.setdefault(currency, {"receive": 0, "deliver": 0})
-                    diff_calc_summary[currency]["deliver"] = amount
-
-            # Convert to float:
-            if receive_summary:
-                receive_summary = {k: float(v) for k, v in receive_summary.items()}
-            if deliver_summary:
-                deliver_summary = {k: float(v) for k, v in deliver_summary.items()}
-            if diff_calc_summary:
-                diff_calc_summary = {
-                    k: {"receive": float(v["receive"]), "deliver": float(v["deliver"])}
-                    for k, v in diff_calc_summary.items()
-                    }
-
-            html_summary = ""
-            html_diff_calc_summary = ""
-
-            # RECEIVE table
-            if receive_summary:
-                html_summary += """
-                    <div style="width: 25%; min-width: 350px; float: left; margin: 5px; padding: 15px; background-color: #ffffff;
-                                border-radius: 8px; box-shadow: 0 2px 6px rgba(0,0,0,0.08);
-                                border-left: 4px solid #007bff;">
-                        <h4 style="color:#007bff;">RECIBIR</h4>
-                        <table class="table table-sm table-striped" style="width:100%; table-layout: fixed;">
-                            <thead>
-                                <tr>
-                                    <th style="width:70%; background-color: #007bff; color: white;">DIVISA</th>
-                                    <th style="width:30%; background-color: #007bff; color: white;">CANTIDAD</th>
-                                </tr>
-                            </thead>
-                            <tbody>
-                    """
-                for currency, amount in receive_summary.items():
-                    html_summary += f"""
-                            <tr>
-                                <td><strong>{currency}</strong></td>
-                                <td>{amount}</td>
-                            </tr>
-                    """
-                html_summary += """
-                            </tbody>
-                        </table>
-                    </div>
-                """
-
-            # DELIVER table
-            if deliver_summary:
-                html_summary += """
-                <div style="width: 25%; min-width: 350px; float: left; margin: 5px; padding: 15px; background-color: #ffffff;
-                            border-radius: 8px; box-shadow: 0 2px 6px rgba(0,0,0,0.08);
-                            border-left: 4px solid #ffc107;">
-                    <h4 style="color:#ffc107;">ENTREGAR</h4>
-                    <table class="table table-sm table-striped" style="width:100%; table-layout: fixed;">
-                        <thead>
-                            <tr>
-                                <th style="width:70%; background-color: #ffc107; color: white;">DIVISA</th>
-                                <th style="width:30%; background-color: #ffc107; color: white;">CANTIDAD</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-                """
-                for currency, amount in deliver_summary.items():
-                    html_summary += f"""
-                            <tr>
-                                <td><strong>{currency}</strong></td>
-                                <td>{amount}</td>
-                            </tr>
-                    """
-                html_summary += """
-                        </tbody>
-                    </table>
-                </div>
-                """
-
-            rec.summary = html_summary
-
-            # DIFF_CALC table
-            if diff_calc_summary:
-                html_diff_calc_summary += """
-                    <div class="personal-card" style="width: 40%; min-width: 500px;">
-                    <h4 style="color:#007bff;">RESUMEN DE LA OPERACIÓN</h4>
-                    <table class="table table-sm table-striped" style="width:100%; table-layout: fixed;">
-                        <thead>
-                            <tr>
-                                <th style="width:60%; background-color: #007bff; color: white;">DIVISA</th>
-                                <th style="width:20%; background-color: #007bff; color: white;">RECIBIR</th>
-                                <th style="width:20%; background-color: #007bff; color: white;">ENTREGAR</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-                """
-                for currency in diff_calc_summary.keys():
-                    if diff_calc_summary[currency]["receive"] or diff_calc_summary[currency]["deliver"]: # If difference is 0, we just don't show the currency/amount
-                        html_diff_calc_summary += f"""
-                                <tr>
-                                    <td><strong>{currency}</strong></td>
-                                    <td>{diff_calc_summary[currency]["receive"]}</td>
-                                    <td>{diff_calc_summary[currency]["deliver"]}</td>
-                                </tr>
-                        """
-                html_diff_calc_summary += """
-                            </tbody>
-                        </table>
-                    </div>
-                """
-            
-            rec.diff_calc_summary = html_diff_calc_summary
+            # One pass: avoid adding a repeated line or a line with no availability or a line with amount <= 0.
+            # The One2many is assigned only once (and only if a line was dropped); summary_data follows by its compute
+            kept = [line for line in rec.calculation_ids 
+                    if line.available and not line.repeated_line and line.amount_received > 0 and line.amount_delivered > 0]
+            if len(kept) != len(rec.calculation_ids):
+                rec.calculation_ids = rec.calculation_ids.browse().concat(*kept)
+
+    # Profiling: with the DEBUG log level for this module, every onchange call of the form logs
+    # how many computed fields were recomputed (and which ones)
+    def onchange(self, values, field_names, fields_spec):
+        return profiled_onchange(self, _logger, super().onchange, values, field_names, fields_spec)
+
+    def _compute_field_value(self, field):
+        count_recompute(field)
+        return super()._compute_field_value(field)
+
+    @api.depends("calculation_ids.currency_source_id", "calculation_ids.amount_received",
+                 "calculation_ids.currency_target_id", "calculation_ids.amount_delivered")
+    def _compute_summary_data(self):
+        for rec in self:
+            rec.summary_data = summarize(
+                (line.currency_source_id.name, line.amount_received, line.currency_target_id.name, line.amount_delivered)
+                for line in rec.calculation_ids
+                ) if rec.calculation_ids else False
+
+    @api.depends("summary_data")
+    def _compute_summary_html(self):
+        QWeb = self.env["ir.qweb"]
+        for rec in self:
+            data = rec.summary_data or {}
+            rec.summary = QWeb._render("forexmanager.operation_summary", {"data": data}) if data else False
+            rec.diff_calc_summary = QWeb._render("forexmanager.operation_diff_summary", {"data": data}) if data else False
 
     @api.depends("desk_id")
     def _compute_worksession_id(self):
         for rec in self:
             if rec.desk_id:
                 # Get open (checkin) session associated to this desk and user (must be only one)
-                session = self.env["forexmanager.worksession"].search([
-                        ("user_id", "=", rec.user_id), 
-                        ("session_status", "=", "open"), 
-                        ("session_type", "=", "checkin"),
-                        ("desk_id", "=", rec.desk_id.id),
-                        ], limit=1)
-                
-                # Get all open (checkin) sessions (main and secondaries) for this user
-                all_sessions = self.env["forexmanager.worksession"].search([
-                        ("user_id", "=", rec.user_id), 
-                        ("session_status", "=", "open"), 
-                        ("session_type", "=", "checkin"),
-                        ])
-                for _ in all_sessions:
-                    if session.desk_id == session.opening_desk_id: # We are operating in our opening_desk
-                            rec.worksession_id = session.id if session.balances_checked_ended else False
-                    else: # We are in a temporary desk, must check if balance check is finished in the associated opening desk
-                        rec.worksession_id = session.id if all_sessions[0].balances_checked_ended else False
-                        break # Only check in one of many possibles secondary sessions
+                WorkSession = self.env["forexmanager.worksession"]
+                session = WorkSession.get_open_session(rec.user_id.id, rec.desk_id.id)
+                if not session:
+                    rec.worksession_id = False
+                elif session.desk_id == session.opening_desk_id: # We are operating in our opening_desk
+                    rec.worksession_id = session.id if session.balances_checked_ended else False
+                else: # We are in a temporary desk, must check if balance check is finished in the associated opening desk
+                    opening_session = WorkSession.get_open_session(rec.user_id.id) # First open session of this user
+                    rec.worksession_id = session.id if opening_session.balances_checked_ended else False
     
     @api.onchange("read_ID", "image_1")
     def get_passport_info(self):
@@ -331,10 +209,16 @@ class Operation(models.Model):
                 # Buttons
                 rec.search_ID = False                
 
+            OCRJob = self.env["forexmanager.ocr.job"]
+            if rec.image_1 and (not rec.ocr_job_id or rec.ocr_job_id.checksum != OCRJob.checksum_of(rec.image_1)):
+                # New image: read it in background while the teller goes on (never inside this request)
+                rec.ocr_job_id = OCRJob.enqueue(rec.image_1)
+
             if not rec.image_1:
                 # If deleting the first image or clicking the checkbox with no first image loaded
                 clean_data()
-                clean_images()        
+                clean_images()
+                rec.ocr_job_id = False
             
             elif rec.image_1 and not rec.read_ID:
                 # When loading the first image after filling manually the data
@@ -344,95 +228,98 @@ class Operation(models.Model):
                 # When reading the data from the image
                 clean_data()
 
-                try:
-                    img_bytes = base64.b64decode(rec.image_1)
-                    img_stream = BytesIO(img_bytes)
-                    mrz = read_mrz(img_stream)
-                    mrz_dict = mrz.to_dict()
-                except Exception:
+                if rec.ocr_job_id.state == "pending":
+                    notification(rec, "Leyendo el documento", 
+                                 "El documento todavía se está leyendo. Recibirá un aviso cuando termine; " \
+                                 "entonces vuelva a marcar la opción 'Leer datos'.",
+                                 "info")
+                    rec.read_ID = False
+                    continue
+                if rec.ocr_job_id.state != "done":
                     raise ValidationError("No se pudo leer la información del documento. Por favor, rellene los datos manualmente.")
                 
-                valid_score = mrz_dict["valid_score"]
-                mrz_type = mrz_dict["mrz_type"].replace("<", "") # TD1 (card-size documents) or TD3 (passport type). TD2 not allowed
-
-                ID_type = mrz_dict["type"].replace("<", "") # IR, IT, ID, P
-                ID_country = mrz_dict["country"].replace("<", "")
-                ID_number = mrz_dict["optional1"].replace("<", "") if mrz_type == "TD1" else mrz_dict["number"].replace("<", "")
-                ID_expiration_date = mrz_dict["expiration_date"].replace("<", "")
-                valid_expiration_date = mrz_dict["valid_expiration_date"]
-
-                names = mrz_dict["names"].replace("<", "")
-                last_names = mrz_dict["surname"].replace("<", "")
-                nationality = mrz_dict["nationality"].replace("<", "")
-                birth_date = mrz_dict["date_of_birth"].replace("<", "")
-                valid_birth_date = mrz_dict["valid_date_of_birth"]
-                sex = mrz_dict["sex"].replace("<", "")
-                
-                if valid_score > 50:
-                    # Assign values to variables
-                    rec.ID_number = ID_number
-                    rec.search_passport()
+                rec._apply_mrz_data(rec.ocr_job_id.mrz_data)
 
-                    if not rec.passport_id: # Assign values from document read
-                        if ID_type == "P":
-                            rec.ID_type = "p"
-                        elif ID_type == "ID":
-                            rec.ID_type = "id"
-                        else:
-                            rec.ID_type = "other"
-
-                        country_rec = self.env['res.country'].search([('code', '=', ID_country)], limit=1)
-                        if country_rec:
-                            rec.ID_country = country_rec
-                        
-                        expiration_date = datetime.strptime(ID_expiration_date, "%y%m%d").date() if valid_expiration_date else None
-                        if expiration_date:
-                            rec.ID_expiration = expiration_date
-
-                        first_names = names.split()
-                        first_name_1 = first_names[0]
-                        first_name_2 = first_names[1:] if len(first_names) > 1 else None
-                        full_first_name_2 = ""
-                        if first_name_2:
-                            for n in first_name_2:
-                                full_first_name_2 += n + " "
-                            full_first_name_2 = full_first_name_2.strip()
-                        rec.first_name_1 = first_name_1
-                        rec.first_name_2 = full_first_name_2
-                        
-                        last_names = last_names.split()
-                        last_name_1 = last_names[0]
-                        last_name_2 = last_names[1:] if len(last_names) > 1 else None
-                        full_last_name_2 = ""
-                        if last_name_2:
-                            full_last_name_2 = ""
-                            for n in last_name_2:
-                                full_last_name_2 += n + " "
-                            full_last_name_2 = full_last_name_2.strip()
-                        rec.last_name_1 = last_name_1
-                        rec.last_name_2 = full_last_name_2
-
-                        nationality_rec = self.env['res.country'].search([('code', '=', nationality)], limit=1)
-                        if nationality_rec:
-                            rec.nationality = nationality_rec
-
-                        birth_date = datetime.strptime(birth_date, "%y%m%d").date() if valid_birth_date else None
-                        if birth_date:
-                            rec.birth_date = birth_date
-
-                        if sex == "F":
-                            rec.sex = "female"
-                        elif sex == "M":
-                            rec.sex = "male"
-                        else:
-                            rec.sex = "undefined"
-                    
+    # Fills the form with the MRZ read from the document (dict as returned by passporteye)
+    def _apply_mrz_data(self, mrz_dict):
+        for rec in self:
+            valid_score = mrz_dict["valid_score"]
+            mrz_type = mrz_dict["mrz_type"].replace("<", "") # TD1 (card-size documents) or TD3 (passport type). TD2 not allowed
+
+            ID_type = mrz_dict["type"].replace("<", "") # IR, IT, ID, P
+            ID_country = mrz_dict["country"].replace("<", "")
+            ID_number = mrz_dict["optional1"].replace("<", "") if mrz_type == "TD1" else mrz_dict["number"].replace("<", "")
+            ID_expiration_date = mrz_dict["expiration_date"].replace("<", "")
+            valid_expiration_date = mrz_dict["valid_expiration_date"]
+
+            names = mrz_dict["names"].replace("<", "")
+            last_names = mrz_dict["surname"].replace("<", "")
+            nationality = mrz_dict["nationality"].replace("<", "")
+            birth_date = mrz_dict["date_of_birth"].replace("<", "")
+            valid_birth_date = mrz_dict["valid_date_of_birth"]
+            sex = mrz_dict["sex"].replace("<", "")
+            
+            if valid_score > MIN_VALID_SCORE:
+                # Country, type and number make the document key, so all three are needed to find the customer
+                if ID_type == "P":
+                    rec.ID_type = "p"
+                elif ID_type == "ID":
+                    rec.ID_type = "id"
                 else:
-                    notification(rec, "Lectura de documento poco fiable", 
-                                 "Por favor, introduzca manualmente el número de pasaporte y busque los datos " \
-                                 "del cliente en la Base de Datos.",
-                                 "warning")                        
-                    rec.read_ID = False
+                    rec.ID_type = "other"
+                rec.ID_country = self.env['res.country'].search([('code', '=', mrz_country_code(ID_country))], limit=1)
+                rec.ID_number = ID_number
+                rec.search_passport()
+
+                if not rec.passport_id: # Assign values from document read
+                    expiration_date = datetime.strptime(ID_expiration_date, "%y%m%d").date() if valid_expiration_date else None
+                    if expiration_date:
+                        rec.ID_expiration = expiration_date
+
+                    first_names = names.split()
+                    first_name_1 = first_names[0]
+                    first_name_2 = first_names[1:] if len(first_names) > 1 else None
+                    full_first_name_2 = ""
+                    if first_name_2:
+                        for n in first_name_2:
+                            full_first_name_2 += n + " "
+                        full_first_name_2 = full_first_name_2.strip()
+                    rec.first_name_1 = first_name_1
+                    rec.first_name_2 = full_first_name_2
+                    
+                    last_names = last_names.split()
+                    last_name_1 = last_names[0]
+                    last_name_2 = last_names[1:] if len(last_names) > 1 else None
+                    full_last_name_2 = ""
+                    if last_name_2:
+                        full_last_name_2 = ""
+                        for n in last_name_2:
+                            full_last_name_2 += n + " "
+                        full_last_name_2 = full_last_name_2.strip()
+                    rec.last_name_1 = last_name_1
+                    rec.last_name_2 = full_last_name_2
+
+                    nationality_rec = self.env['res.country'].search([('code', '=', mrz_country_code(nationality))], limit=1)
+                    if nationality_rec:
+                        rec.nationality = nationality_rec
+
+                    birth_date = datetime.strptime(birth_date, "%y%m%d").date() if valid_birth_date else None
+                    if birth_date:
+                        rec.birth_date = birth_date
+
+                    if sex == "F":
+                        rec.sex = "female"
+                    elif sex == "M":
+                        rec.sex = "male"
+                    else:
+                        rec.sex = "undefined"
+                
+            else:
+                notification(rec, "Lectura de documento poco fiable", 
+                             "Por favor, introduzca manualmente el número de pasaporte y busque los datos " \
+                             "del cliente en la Base de Datos.",
+                             "warning")                        
+                rec.read_ID = False
 
     def assign_values_from_db(self, ID_exists):
         for rec in self:
@@ -472,9 +359,17 @@ class Operation(models.Model):
 
     def search_passport(self):
         for rec in self:
-            ID_exists = self.env["forexmanager.passport"].search([
-                ("ID_number", "=", rec.ID_number)
-                ])            
+            if not rec.ID_country or not rec.ID_type:
+                # Without them there is no document key to look for
+                notification(rec, "Faltan datos del documento", 
+                             "Indique el país emisor y el tipo de documento para poder buscar al cliente en la Base de Datos.", 
+                             "warning")
+                rec.passport_id = False
+                rec.search_ID = False
+                continue
+
+            Passport = self.env["forexmanager.passport"]
+            ID_exists = Passport.find_document(rec.ID_number, rec.ID_country, rec.ID_type)
             rec.passport_id = ID_exists
             rec.search_ID = True # This disables (readonly) the button when TRUE
 
@@ -484,6 +379,13 @@ class Operation(models.Model):
                              "info")
                 rec.assign_values_from_db(rec.passport_id)
             else:
+                # Only a suggestion, and only for admins: no data of other customers is shown, just how many there are
+                if self.env.user.has_group("forexmanager.group_forexmanager_admin"):
+                    similar = Passport.find_similar_documents(rec.ID_number)
+                    if similar:
+                        notification(rec, "Documentos similares encontrados", 
+                                     f"No hay coincidencia exacta, pero existen {len(similar)} documentos parecidos. Compruebe el número introducido.", 
+                                     "info")
                 if not rec.read_ID: # Means that there is no image or is not readable (low valid_score assign False to read_ID)
                     notification(rec, "Cliente no encontrado en la Base de Datos", 
                                 "Rellene manualmente los datos solicitados. " \
@@ -502,34 +404,32 @@ class Operation(models.Model):
             raise ValidationError("Por razones de seguridad, debes marcar la opción TODO LISTO (en la pestaña FINALIZAR) " \
                                     "antes de confirmar la operación.")
         
+        transfer_lines = self._transient_transfer_lines(vals.pop("transfertransient_ids", None))
         operation = super(Operation, self).create(vals)
 
+        # The rates booked must be the ones the customer saw
+        RateQuote = self.env["forexmanager.rate.quote"]
+        if RateQuote.is_quote_expired(operation.quoted_at):
+            raise ValidationError("Los tipos de cambio de esta operación han caducado. Vuelva a abrir el formulario para obtener una nueva cotización.")
+        lines = operation.calculation_ids
+        operation.quote_id = RateQuote._issue(operation.quoted_at or fields.Datetime.now(),
+                                              lines.currency_source_id | lines.currency_target_id)
+
+        # Net amount per currency for the whole operation (a currency both received and delivered nets out),
+        # so availability is checked against the net and every cashcount row is updated in one statement
+        opening_desk_id = operation.opening_desk_id.id
+        deltas = defaultdict(float)
         for line in operation.calculation_ids:
-            amount_delivered = line.amount_delivered
-            amount_received = line.amount_received
-            currency_target_id = line.currency_target_id.id
-            currency_source_id = line.currency_source_id.id
-            opening_desk_id = operation.opening_desk_id.id
-            cashcount_deliver = self.env["forexmanager.cashcount"].search([
-                ("currency_id", "=", currency_target_id),
-                ("desk_id", "=", opening_desk_id)
-                ])
-            cashcount_receive = self.env["forexmanager.cashcount"].search([
-                ("currency_id", "=", currency_source_id),
-                ("desk_id", "=", opening_desk_id)
-                ])
-            
-            # Check availability again
-            if cashcount_deliver.balance < amount_delivered:
-                raise ValidationError("No hay disponibilidad suficiente para la cantidad de divisa que solicita el cliente. Modifique la cantidad para finalizar la operación.")
+            deltas[(opening_desk_id, line.currency_source_id.id)] += line.amount_received
+            deltas[(opening_desk_id, line.currency_target_id.id)] -= line.amount_delivered
+        self.env["forexmanager.cashcount"].apply_deltas(deltas, 
+            "No hay disponibilidad suficiente para la cantidad de divisa que solicita el cliente. Modifique la cantidad para finalizar la operación.",
+            origin=operation)
         
-            # Update balance in cashcount model for this opening_desk
-            new_amount_receive = (Decimal(cashcount_receive.balance) + Decimal(amount_received)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-            cashcount_receive.write({"balance": float(new_amount_receive)})
-            new_amount_deliver = (Decimal(cashcount_deliver.balance) - Decimal(amount_delivered)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-            cashcount_deliver.write({"balance": float(new_amount_deliver)})
-        
-        if not operation.passport_id: # Means it wasn't found on customer search
+        # The customer may be already in the DB even if the search was not used (same document key)
+        passport = operation.passport_id or self.env["forexmanager.passport"].find_document(
+            operation.ID_number, operation.ID_country, operation.ID_type)
+        if not passport: # Means it wasn't found on customer search
             # Creating customer record in Customer model
             customer = self.env["forexmanager.customer"].create({
                 "first_name_1": operation.first_name_1,
@@ -550,7 +450,7 @@ class Operation(models.Model):
                 })
         
             # Creating passport record in Passport model (relation with customer)
-            self.env["forexmanager.passport"].create({
+            operation.passport_id = self.env["forexmanager.passport"].create({
                 "customer_id": customer.id,
                 "ID_type": operation.ID_type,
                 "ID_country": operation.ID_country.id,
@@ -562,9 +462,8 @@ class Operation(models.Model):
             operation.data_from_db = False
         else:
             # Lets update the info that can be updated (address, email), accesing the customer through his passport/ID
-            customer = self.env["forexmanager.passport"].search([
-                ("ID_number", "=", operation.ID_number)
-                ], limit=1).customer_id
+            operation.passport_id = passport
+            customer = passport.customer_id
             
             customer.write({
                 "email": vals["email"],
@@ -578,10 +477,19 @@ class Operation(models.Model):
                 })
             
             operation.data_from_db = True
+
+        operation._send_transfer_lines(transfer_lines)
         
         notification(self, "Operación realizada exitosamente", 
                      "La operación fue completada sin errores. Puedes chequearla en el historial de operaciones.", 
                      "success")
         
         return operation
+
+    def write(self, vals):
+        transfer_lines = self._transient_transfer_lines(vals.pop("transfertransient_ids", None))
+        res = super().write(vals)
+        if transfer_lines:
+            self._send_transfer_lines(transfer_lines)
+        return res
             
\ No newline at end of file
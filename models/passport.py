@@ -1,5 +1,5 @@
 from odoo import fields, models, api
-from ..utils import notification
+from ..utils import notification, normalize_document_number
 
 
 class Passport(models.Model):
@@ -19,4 +19,56 @@ class Passport(models.Model):
     ID_country = fields.Many2one("res.country", string="País emisor", required=True)
     nationality = fields.Many2one("res.country", string="Nacionalidad", required=True)
     ID_expiration = fields.Date(string="Fecha de vencimiento", required=True)
-    ID_number = fields.Char(string="Número de documento", required=True)            
+    ID_number = fields.Char(string="Número de documento", required=True)
+    # Normalized number (trigram index for the fuzzy search, B-tree index in init() for the exact one) and unique key of the document
+    ID_number_normalized = fields.Char(string="Número normalizado", compute="_compute_document_key", store=True, index="trigram")
+    document_key = fields.Char(string="Clave del documento", compute="_compute_document_key", store=True)
+
+    _sql_constraints = [
+        ("document_key_unique", "UNIQUE(document_key)", "Ya existe un documento con el mismo país emisor, tipo y número."),
+    ]
+
+
+    def init(self):
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS forexmanager_passport_id_number_normalized_index
+                ON forexmanager_passport ("ID_number_normalized")
+            """)
+
+    @api.depends("ID_country", "ID_type", "ID_number")
+    def _compute_document_key(self):
+        for rec in self:
+            rec.ID_number_normalized = normalize_document_number(rec.ID_number)
+            rec.document_key = Passport.get_document_key(rec.ID_country, rec.ID_type, rec.ID_number)
+
+    # Auxiliar method (also used from the operation, before the passport exists)
+    @staticmethod
+    def get_document_key(ID_country, ID_type, ID_number):
+        number = normalize_document_number(ID_number)
+        if not (ID_country and ID_type and number):
+            return False
+        return f"{ID_country.code}-{ID_type}-{number}"
+
+    @api.model
+    def find_document(self, ID_number, ID_country=None, ID_type=None):
+        # Exact lookup by document key. Without country and type there is no match: the same number
+        # can belong to documents of other people
+        key = Passport.get_document_key(ID_country, ID_type, ID_number)
+        if not key:
+            return self.browse()
+        return self.search([("document_key", "=", key)], limit=1)
+
+    @api.model
+    def find_similar_documents(self, ID_number, limit=3):
+        # Fuzzy lookup (pg_trgm) for suggesting possible typos. Never used to assign a customer automatically
+        number = normalize_document_number(ID_number)
+        if not number or not self.env.registry.has_trigram:
+            return self.browse()
+        self.env.cr.execute("""
+            SELECT id
+              FROM forexmanager_passport
+             WHERE "ID_number_normalized" %% %s
+             ORDER BY similarity("ID_number_normalized", %s) DESC
+             LIMIT %s
+            """, [number, number, limit])
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
@@ -0,0 +1,153 @@
+from odoo import fields, models, api, tools
+from odoo.exceptions import UserError
+from datetime import timedelta
+from ..utils import get_base_rates, TTLCache
+
+
+class Rate(models.Model):
+    """A model for storing the exchange rates fetched from the API (one snapshot per fetch), shared by every Odoo worker."""
+
+    _name = "forexmanager.rate"
+    _description = "Tipo de cambio"
+    _order = "fetched_at desc, id desc"
+
+    RATE_TTL = 3600 # Seconds a fetched rate is considered fresh
+    # In-process cache {(from_currency, to_currency): rate}. One per worker, backed by this table
+    _rate_cache = TTLCache(maxsize=512, ttl=RATE_TTL)
+
+    # MAIN FIELDS
+    base_currency_id = fields.Many2one("res.currency", string="Divisa base", required=True, index=True)
+    currency_id = fields.Many2one("res.currency", string="Divisa", required=True, index=True)
+    rate = fields.Float(string="Tipo de cambio", digits=(16, 6), required=True)
+    fetched_at = fields.Datetime(string="Obtenido", required=True, index=True, default=fields.Datetime.now)
+    source = fields.Char(string="Origen", default="frankfurter")
+    # Every fetch (one request for all the currencies) writes its rows with the same version
+    version = fields.Integer(string="Versión", readonly=True, index=True)
+
+    def init(self):
+        self.env.cr.execute("CREATE SEQUENCE IF NOT EXISTS forexmanager_rate_version_seq")
+        # Latest rate for a currency pair in one index lookup
+        tools.create_index(self.env.cr, "forexmanager_rate_latest_idx", self._table,
+                           ["currency_id", "base_currency_id", "fetched_at DESC", "id DESC"])
+
+    def _next_version(self):
+        self.env.cr.execute("SELECT nextval('forexmanager_rate_version_seq')")
+        return self.env.cr.fetchone()[0]
+
+    def _get_latest_rate(self, base_currency_id, currency_id, until=None):
+        # Last stored snapshot row for this pair (res.currency ids), fetched until a moment if given
+        domain = [
+            ("currency_id", "=", currency_id),
+            ("base_currency_id", "=", base_currency_id),
+            ]
+        if until:
+            domain.append(("fetched_at", "<=", until))
+        return self.sudo().search(domain, order="fetched_at desc, id desc", limit=1)
+
+    def _get_latest_rates(self, pairs, until=None):
+        # _get_latest_rate() for several (base_currency_id, currency_id) pairs in one query (one index range per pair)
+        if not pairs:
+            return self.browse()
+        self.flush_model(["base_currency_id", "currency_id", "fetched_at"])
+        self.env.cr.execute("""
+            SELECT DISTINCT ON (currency_id, base_currency_id) id
+              FROM forexmanager_rate
+             WHERE (base_currency_id, currency_id) IN %(pairs)s
+               AND (%(until)s IS NULL OR fetched_at <= %(until)s)
+             ORDER BY currency_id, base_currency_id, fetched_at DESC, id DESC
+            """, {"pairs": tuple(pairs), "until": until})
+        return self.sudo().browse([row[0] for row in self.env.cr.fetchall()])
+
+    @api.model
+    def get_rate(self, from_currency, to_currency):
+        # Rate for converting from_currency into to_currency (ISO codes).
+        # Order: in-process cache, then rate table (fresh rows only), then the API.
+        if from_currency == to_currency:
+            return 1.0
+
+        rate = self._rate_cache.get((from_currency, to_currency))
+        if rate is not None:
+            return rate
+
+        rate = self._get_stored_rate(from_currency, to_currency)
+        if rate is None:
+            self._refresh_rates(from_currency, [to_currency])
+            rate = self._rate_cache.get((from_currency, to_currency))
+            if rate is None:
+                raise UserError("Error al intentar convertir la cantidad a la moneda seleccionada. Moneda no soportada para esta API.")
+        return rate
+
+    def _get_stored_rate(self, from_currency, to_currency):
+        # Look for a fresh enough row in either direction (EUR->USD also gives USD->EUR)
+        row = self.sudo().search([
+            ("fetched_at", ">=", fields.Datetime.now() - timedelta(seconds=self.RATE_TTL)),
+            "|",
+                "&", ("base_currency_id.name", "=", from_currency), ("currency_id.name", "=", to_currency),
+                "&", ("base_currency_id.name", "=", to_currency), ("currency_id.name", "=", from_currency),
+            ], limit=1)
+        if not row or not row.rate:
+            return None
+
+        rate = row.rate if row.base_currency_id.name == from_currency else 1 / row.rate
+        self._rate_cache.set((from_currency, to_currency), rate)
+        return rate
+
+    def _refresh_rates(self, base_currency, extra_currencies=()):
+        # Fetch in one request the rates of base_currency for every configured currency and store them
+        symbols = set(self.env["forexmanager.currency"].sudo().search([]).mapped("initials"))
+        symbols.update(extra_currencies)
+        symbols.discard(base_currency)
+        if not symbols:
+            return {}
+
+        try:
+            rates = get_base_rates(base_currency, symbols)
+        except UserError:
+            # Some configured currency may be not supported by the API. Ask for every supported one instead
+            rates = {k: v for k, v in get_base_rates(base_currency, ()).items() if k in symbols}
+
+        currencies = self.env["res.currency"].with_context(active_test=False).sudo().search([
+            ("name", "in", [base_currency] + list(rates))
+            ])
+        currency_by_name = {c.name: c for c in currencies}
+        base = currency_by_name.get(base_currency)
+        now = fields.Datetime.now()
+        version = self._next_version()
+
+        vals_list = []
+        for name, rate in rates.items():
+            self._rate_cache.set((base_currency, name), rate)
+            if rate:
+                self._rate_cache.set((name, base_currency), 1 / rate)
+            if base and name in currency_by_name:
+                vals_list.append({
+                    "base_currency_id": base.id,
+                    "currency_id": currency_by_name[name].id,
+                    "rate": rate,
+                    "fetched_at": now,
+                    "version": version,
+                    })
+        if vals_list:
+            self._link_currencies(self.sudo().create(vals_list))
+
+        return rates
+
+    def _link_currencies(self, rows):
+        # Points every configured currency to its new snapshot row, so its stored base_rate moves with it
+        currencies = self.env["forexmanager.currency"].sudo().search([
+            ("currency_base_id", "in", rows.base_currency_id.ids),
+            ("currency_id", "in", rows.currency_id.ids),
+            ])
+        row_by_pair = {(row.base_currency_id.id, row.currency_id.id): row for row in rows}
+        for currency in currencies:
+            row = row_by_pair.get((currency.currency_base_id.id, currency.currency_id.id))
+            if row and currency.rate_id != row:
+                currency.rate_id = row
+
+    # Called from the scheduled action. Refreshes in bulk every base currency in use
+    # (_refresh_rates() links every currency to its new snapshot row, so base_rate is stored and indexed)
+    @api.model
+    def _cron_refresh_rates(self):
+        currencies = self.env["forexmanager.currency"].sudo().search([])
+        for base in currencies.mapped("currency_base_id"):
+            self._refresh_rates(base.name)
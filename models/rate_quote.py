@@ -0,0 +1,69 @@
+from odoo import fields, models, api
+from datetime import timedelta
+
+
+class RateQuote(models.Model):
+    """A model for freezing the exchange rates offered during one operation (every line is priced against it)."""
+
+    _name = "forexmanager.rate.quote"
+    _description = "Cotización de tipos de cambio"
+
+    QUOTE_TTL = 30 # Minutes the quoted rates are valid for
+
+    # MAIN FIELDS
+    name = fields.Char(compute="_compute_name", string="Nombre")
+    user_id = fields.Many2one("res.users", string="Empleado", default=lambda self: self.env.uid, readonly=True)
+    issued_at = fields.Datetime(string="Emitida", default=fields.Datetime.now, readonly=True)
+    expires_at = fields.Datetime(string="Caduca", readonly=True)
+    # Snapshot rows (forexmanager.rate) quoted to the customer
+    rate_ids = fields.Many2many("forexmanager.rate", string="Tipos de cambio", readonly=True)
+    operation_ids = fields.One2many("forexmanager.operation", "quote_id", string="Operaciones")
+
+    @api.depends("issued_at")
+    def _compute_name(self):
+        for rec in self:
+            rec.name = f"Cotización {rec.id} ({rec.issued_at})" if rec.issued_at else "Nueva cotización"
+
+    # Called from Operation.create(): freezes the rates in force when the form was opened (quoted_at),
+    # only for the currencies of the operation lines and in one query
+    @api.model
+    def _issue(self, quoted_at, currencies):
+        currencies = currencies.sudo().filtered(lambda c: c.currency_id != c.currency_base_id)
+        rates = self.env["forexmanager.rate"]._get_latest_rates(
+            [(c.currency_base_id.id, c.currency_id.id) for c in currencies], quoted_at)
+        # A currency with no snapshot before quoted_at keeps its current one
+        quoted = {(rate.base_currency_id.id, rate.currency_id.id) for rate in rates}
+        rates |= currencies.filtered(lambda c: (c.currency_base_id.id, c.currency_id.id) not in quoted).rate_id
+
+        return self.sudo().create({
+            "issued_at": quoted_at,
+            "expires_at": quoted_at + timedelta(minutes=self.QUOTE_TTL),
+            "rate_ids": [(6, 0, rates.ids)],
+            })
+
+    @api.model
+    def is_quote_expired(self, quoted_at):
+        return bool(quoted_at) and quoted_at + timedelta(minutes=self.QUOTE_TTL) < fields.Datetime.now()
+
+    # Rate in force at quoted_at, for the lines of an operation not saved yet (same rows _issue() will freeze)
+    @api.model
+    def get_base_rate_at(self, currency, quoted_at):
+        if currency.currency_id == currency.currency_base_id:
+            return 1
+        if quoted_at:
+            rate = self.env["forexmanager.rate"]._get_latest_rate(currency.currency_base_id.id, currency.currency_id.id, quoted_at)
+            if rate:
+                return rate.rate
+        return currency.base_rate
+
+    def get_base_rate(self, currency):
+        # Quoted rate from currency_base_id to currency (forexmanager.currency). If the currency was added
+        # after the quote was issued, the stored base_rate is used (never a new fetch)
+        self.ensure_one()
+        if currency.currency_id == currency.currency_base_id:
+            return 1
+        for rate in self.rate_ids:
+            if rate.currency_id == currency.currency_id and rate.base_currency_id == currency.currency_base_id:
+                return rate.rate
+        return currency.base_rate
+
@@ -1,6 +1,8 @@
 from odoo import fields, api, models
 from odoo.exceptions import ValidationError
+from odoo.osv import expression
 from ..utils import notification
+from collections import defaultdict
 import datetime
 
 
@@ -17,12 +19,7 @@ class TransferBase(models.AbstractModel):
         if not current_desk_id:
             raise ValidationError("No puedes traspasar dinero sin ventanilla de trabajo asociada.")
         
-        worksession_id = self.env["forexmanager.worksession"].search([
-            ("desk_id", "=", current_desk_id.id),
-            ("user_id", "=", user_id.id),
-            ("session_status", "=", "open"),
-            ("session_type", "=", "checkin")
-            ], limit=1)
+        worksession_id = self.env["forexmanager.worksession"].get_open_session(user_id.id, current_desk_id.id)
         if not worksession_id:
             raise ValidationError("No puedes traspasar dinero sin una sesión de trabajo iniciada en esta ventanilla.")
         return worksession_id
@@ -32,12 +29,8 @@ class TransferBase(models.AbstractModel):
         user_id = self.env.user
         opening_desk_id = user_id.opening_desk_id
         
-        opening_desk_worksession_id = self.env["forexmanager.worksession"].search([
-            ("desk_id", "=", opening_desk_id.id),
-            ("user_id", "=", user_id.id),
-            ("session_status", "=", "open"),
-            ("session_type", "=", "checkin")
-            ], limit=1)
+        opening_desk_worksession_id = self.env["forexmanager.worksession"].get_open_session(user_id.id, opening_desk_id.id) \
+                                      if opening_desk_id else self.env["forexmanager.worksession"]
         if not opening_desk_worksession_id:
             raise ValidationError("No puedes traspasar dinero sin una sesión de trabajo iniciada en esta ventanilla.")
         return opening_desk_worksession_id
@@ -61,11 +54,13 @@ class TransferBase(models.AbstractModel):
         compute="_compute_destination_users",
         store=True
         )
+    # Open (and checked) sessions of the destination users that were already open when the transfer was sent.
+    # Not stored: resolved on the live worksession state, so it never goes stale when sessions close
     destination_worksessions = fields.Many2many(
         "forexmanager.worksession",
         string="Sesiones destino",
         compute="_compute_destination_worksessions",
-        store=True
+        search="_search_destination_worksessions"
         )
     
     def action_open_my_transfers(self):
@@ -93,16 +88,17 @@ class TransferBase(models.AbstractModel):
             if not source_worksession_id:
                 raise ValidationError("No puedes traspasar dinero sin haber realizado el arqueo de entrada en tu ventanilla de arqueo.")
         
-        # Shows transfers only sent during current session for sender user and every receiver users
-        domain = [
-            "|",
-                "&",
-                    ("user_id", "=", self.env.uid),
-                    ("opening_desk_worksession_id", "in", source_worksession_ids.ids),
-                "&",
-                    ("destination_users", "in", [self.env.uid]),
-                    ("destination_worksessions", "in", [destination_worksession_id.id]),
-        ]
+        # Shows transfers only sent during current session for sender user and every receiver users.
+        # Received: a line sent to the user since the session opened (the session is open, so the same
+        # as destination_worksessions), looked up on the (sent_to, transfer_id) index of the lines
+        received_domain = [
+            ("transfer_line_ids.sent_to", "=", self.env.uid),
+            ("sent_time", ">=", destination_worksession_id.start_time),
+        ] if destination_worksession_id else expression.FALSE_DOMAIN
+        domain = expression.OR([
+            [("user_id", "=", self.env.uid), ("opening_desk_worksession_id", "in", source_worksession_ids.ids)],
+            received_domain,
+        ])
 
         return {
             "type": "ir.actions.act_window",
@@ -124,23 +120,14 @@ class TransferBase(models.AbstractModel):
                     for line in rec.transfer_line_ids:
                         receiver_user = line.sent_to
                         if receiver_user.id == self.env.user.id:                          
-                            rec.current_worksession = self.env["forexmanager.worksession"].search([
-                                ("user_id", "=", receiver_user.id),
-                                ("session_type", "=", "checkin"),
-                                ("session_status", "=", "open"),
-                                ("opening_desk_id", "=", rec.receiver_desk_id.id),
-                                ("desk_id", "=", rec.receiver_desk_id.id)
-                                ], limit=1)
+                            session = self.env["forexmanager.worksession"].get_opening_session(rec.receiver_desk_id.id)
+                            rec.current_worksession = session if session.user_id == receiver_user else None
                 else:
                     rec.current_worksession = None
             else: # Means current user is the sender
-                rec.current_worksession = self.env["forexmanager.worksession"].search([
-                    ("user_id", "=", rec.user_id.id),
-                    ("session_type", "=", "checkin"),
-                    ("session_status", "=", "open"),
-                    ("opening_desk_id", "=", rec.opening_desk_id.id),
-                    ("desk_id", "=", rec.opening_desk_id.id)
-                    ], limit=1) if rec.opening_desk_id else None        
+                session = self.env["forexmanager.worksession"].get_opening_session(rec.opening_desk_id.id) \
+                          if rec.opening_desk_id else None
+                rec.current_worksession = session if session and session.user_id == rec.user_id else None
     
     @api.depends('transfer_line_ids')
     def _compute_user_transfer_line_ids(self):
@@ -156,41 +143,93 @@ class TransferBase(models.AbstractModel):
             users = rec.transfer_line_ids.mapped("sent_to")
             rec.destination_users = [(6, 0, users.ids)]
 
-    @api.depends("destination_users")
+    # Sessions that can receive transfers (the same ones for the field value and for searching on it)
+    DESTINATION_SESSION_DOMAIN = [
+        ("session_type", "=", "checkin"),
+        ("session_status", "=", "open"),
+        ("balances_checked_ended", "=", True),
+        ]
+
+    @api.depends("destination_users", "sent_time")
     def _compute_destination_worksessions(self):
+        # One search for all the records
+        worksession_ids = self.env["forexmanager.worksession"].search(
+            self.DESTINATION_SESSION_DOMAIN + [("user_id", "in", self.destination_users.ids)])
         for rec in self:
-            worksession_ids = self.env["forexmanager.worksession"].search([
-                ("session_type", "=", "checkin"),
-                ("session_status", "=", "open"),
-                ("balances_checked_ended", "=", True),
-                ("user_id", "in", rec.destination_users.ids),
-            ])
-            
-            rec.destination_worksessions = [(6, 0, worksession_ids.ids)]
-
-    def create(self, vals):
-        vals["sent_time"] = datetime.datetime.now()               
-        transfer = super().create(vals)
-        
-        lines = vals.get("transfer_line_ids") 
-        if not lines:
-            raise ValidationError("Debe añadir al menos una divisa para traspasar.")
+            rec.destination_worksessions = worksession_ids.filtered(
+                lambda s: s.user_id in rec.destination_users and (not rec.sent_time or (
+                    s.start_time <= rec.sent_time and (not s.close_time or rec.sent_time <= s.close_time))))
+
+    def _search_destination_worksessions(self, operator, value):
+        # Transfers with a line sent to the user of the session while the session was open
+        if operator not in ("in", "="):
+            raise ValidationError(f"No se puede buscar por sesiones destino con el operador '{operator}'.")
+        ids = value if isinstance(value, (list, tuple)) else [value]
+        worksession_ids = self.env["forexmanager.worksession"].search(
+            self.DESTINATION_SESSION_DOMAIN + [("id", "in", [i for i in ids if i])])
+        domains = []
+        for session in worksession_ids:
+            domain = [
+                ("transfer_line_ids.sent_to", "=", session.user_id.id),
+                ("sent_time", ">=", session.start_time),
+                ]
+            if session.close_time:
+                domain.append(("sent_time", "<=", session.close_time))
+            domains.append(domain)
+        return expression.OR(domains) if domains else expression.FALSE_DOMAIN
+
+    # Batch API: sends N lines ({receiver_desk_id, currency_id, amount}), one transfer per receiver desk, in one create()
+    @api.model
+    def send_lines(self, line_vals, worksession_id, opening_desk_worksession_id):
+        lines_by_desk = defaultdict(list)
+        for vals in line_vals:
+            lines_by_desk[vals["receiver_desk_id"]].append(vals)
+
+        return self.create([{
+            "worksession_id": worksession_id,
+            "opening_desk_worksession_id": opening_desk_worksession_id,
+            "transfer_line_ids": [[0, 0, vals] for vals in lines],
+            } for lines in lines_by_desk.values()])
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        sent_time = datetime.datetime.now()
+        for vals in vals_list:
+            if not vals.get("transfer_line_ids"):
+                raise ValidationError("Debe añadir al menos una divisa para traspasar.")
+            vals["sent_time"] = sent_time
+        transfers = super().create(vals_list)
+        lines = transfers.transfer_line_ids
         
-        # Check again amount_available and if destination desk has an opening session 
-        for l in transfer.transfer_line_ids:
-            l.check_amount_available()
-            if not l.amount_available:
+        # Check again the availability (all the lines against one snapshot of the balances, the same currency
+        # can be in several lines) and if every destination desk has an opening session
+        requested = defaultdict(float)
+        for l in lines:
+            requested[(l.opening_desk_id.id, l.currency_id.id)] += l.amount
+        cashcounts = self.env["forexmanager.cashcount"].search([
+            ("desk_id", "in", list({desk_id for desk_id, currency_id in requested})),
+            ("currency_id", "in", list({currency_id for desk_id, currency_id in requested})),
+            ])
+        balances = {(c.desk_id.id, c.currency_id.id): c.balance for c in cashcounts}
+        for key, amount in requested.items():
+            if balances.get(key, 0) < amount:
                 raise ValidationError("No tienes suficiente saldo de esta divisa en tu ventanilla de arqueo para realizar este traspaso.")
-            l.check_destination_checked_in()
-            if not l.destination_checked_in:
-                raise ValidationError(f"La ventanilla {self.receiver_desk_id.name} no tiene una sesión de inicio abierta. No se puede realizar el traspaso.")
-            # Substract from opening_desk_id
-            l.update_balance_sender("decrease") 
+
+        WorkSession = self.env["forexmanager.worksession"]
+        for desk in lines.receiver_desk_id:
+            if not WorkSession.get_opening_session(desk.id).balances_checked_ended:
+                raise ValidationError(f"La ventanilla {desk.name} no tiene una sesión de inicio abierta. No se puede realizar el traspaso.")
+        lines.write({"amount_available": True, "destination_checked_in": True})
+
+        # Substract from opening_desk_id, every currency at once (one journal move per line)
+        self.env["forexmanager.cashcount"].apply_moves(
+            [((l.opening_desk_id.id, l.currency_id.id), -l.amount, l) for l in lines],
+            "Al realizar el envío, la cantidad en ventanilla de origen no puede quedar en negativo.")
 
         notification(self, "Traspaso completado", "El traspaso se realizó correctamente. Se actualizaron los saldos correspondientes en ventanilla de origen.",
                      "success")
 
-        return transfer
+        return transfers
     
 
 
@@ -9,6 +9,35 @@ class TransferLine(models.Model):
     _description = "Crear nueva línea de traspaso"
     _inherit = "forexmanager.transfer.line.base"
 
+    def init(self):
+        # Pending inbox of every desk/user. Only pending lines are indexed, so the lookups done at checkout
+        # and in "Mis Traspasos" grow with the pending transfers, not with the whole history
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS forexmanager_transfer_line_pending_desk_idx
+                ON forexmanager_transfer_line (receiver_desk_id)
+             WHERE status_destination = 'pending'
+            """)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS forexmanager_transfer_line_pending_user_idx
+                ON forexmanager_transfer_line (sent_to)
+             WHERE status_destination = 'pending'
+            """)
+        # Transfers received by a user ("Mis Traspasos")
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS forexmanager_transfer_line_sent_to_idx
+                ON forexmanager_transfer_line (sent_to, transfer_id)
+            """)
+
+    @api.model
+    def has_pending(self, desk_id):
+        # True if some transfer to this desk is still waiting to be received (uses the partial index above)
+        self.flush_model(["receiver_desk_id", "status_destination"])
+        self.env.cr.execute("""
+            SELECT 1 FROM forexmanager_transfer_line
+             WHERE receiver_desk_id = %s AND status_destination = 'pending'
+             LIMIT 1
+            """, [desk_id])
+        return bool(self.env.cr.fetchone())
 
     @api.onchange("currency_id", "amount", "opening_desk_id")
     def _onchange_get_amount_available(self):
@@ -44,10 +44,7 @@ class TransferLineBase(models.AbstractModel):
     def _compute_sent_to(self):
         for rec in self:
             if rec.receiver_desk_id:
-                sent_to = self.env["res.users"].search([
-                    ("opening_desk_id", "=", rec.receiver_desk_id)
-                    ], limit=1)
-                rec.sent_to = sent_to if sent_to else False
+                rec.sent_to = self.env["res.users"]._get_desk_user(rec.receiver_desk_id.id)
             else:
                 rec.sent_to = False
 
@@ -75,14 +72,8 @@ class TransferLineBase(models.AbstractModel):
 
     def check_destination_checked_in(self):          
         # Check if receiver desk has an open checkin worksession
-        receiver_worksession_id = self.env["forexmanager.worksession"].search([
-            ("opening_desk_id", "=", self.receiver_desk_id.id),
-            ("desk_id", "=", self.receiver_desk_id.id),
-            ("session_type", "=", "checkin"),
-            ("session_status", "=", "open"),
-            ("balances_checked_ended", "=", True)
-            ], limit=1)
-        self.destination_checked_in = True if receiver_worksession_id else False
+        receiver_worksession_id = self.env["forexmanager.worksession"].get_opening_session(self.receiver_desk_id.id)
+        self.destination_checked_in = receiver_worksession_id.balances_checked_ended
 
         if not self.destination_checked_in:
             notification(self, "Ventanilla de destino sin sesión iniciada", 
@@ -90,49 +81,33 @@ class TransferLineBase(models.AbstractModel):
                                 "warning")
             
     def update_balance_sender(self, operator):
-        cashcount = self.get_cashcount("sender")
-        current_balance = cashcount.balance
-
-        if operator == "decrease":
-            new_balance = current_balance - self.amount
-            if new_balance < 0:
-                raise ValidationError("Al realizar el envío, la cantidad en ventanilla de origen no puede quedar en negativo.")
-        elif operator == "increase":
-            new_balance = current_balance + self.amount
-        else:
-            raise ValidationError("Ocurrió un error inesperado. Consulte a su administrador de sistemas.")
-        
-        cashcount.write({
-            "balance": new_balance
-            })
+        self.update_balance(self.opening_desk_id, operator, 
+                            "Al realizar el envío, la cantidad en ventanilla de origen no puede quedar en negativo.")
     
     def update_balance_receiver(self, operator):
-        cashcount = self.get_cashcount("receiver")
-        current_balance = cashcount.balance
+        self.update_balance(self.receiver_desk_id, operator, 
+                            "Al realizar el envío, la cantidad en ventanilla de destino no puede quedar en negativo.")
 
+    def update_balance(self, desk_id, operator, error_message):
+        # Atomic update through the cashcount ledger (no read-modify-write of the balance)
         if operator == "decrease":
-            new_balance = current_balance - self.amount
-            if new_balance < 0:
-                raise ValidationError("Al realizar el envío, la cantidad en ventanilla de destino no puede quedar en negativo.")
+            amount = -self.amount
         elif operator == "increase":
-            new_balance = current_balance + self.amount
+            amount = self.amount
         else:
             raise ValidationError("Ocurrió un error inesperado. Consulte a su administrador de sistemas.")
         
-        cashcount.write({
-            "balance": new_balance
-            })
+        self.env["forexmanager.cashcount"].apply_deltas({(desk_id.id, self.currency_id.id): amount}, error_message, origin=self)
     
-    # Here vals comes as a list
+    @api.model_create_multi
     def create(self, vals_list):
+        source_time = datetime.datetime.now()
         for vals in vals_list:
             vals["status_source"] = "sent"
-            vals["source_time"] = datetime.datetime.now()
+            vals["source_time"] = source_time
             vals["status_destination"] = "pending"
 
-            transfer_line = super().create(vals)
-        
-        return transfer_line
+        return super().create(vals_list)
     
     def write(self, vals):
         for rec in self:
@@ -199,4 +174,46 @@ class TransferLineBase(models.AbstractModel):
         elif self.status_destination == "rejected" and self.status_source != "cancelled":
             raise ValidationError("El traspaso ya fue rechazado en ventanilla de destino. No puedes volver a rechazarlo.")
         elif self.status_destination == "cancelled" and self.status_source == "cancelled":
-            raise ValidationError("El traspaso está cancelado en ventanilla de origen y destino. Ya no puedes rechazarlo.")
\ No newline at end of file
+            raise ValidationError("El traspaso está cancelado en ventanilla de origen y destino. Ya no puedes rechazarlo.")
+
+    # BULK ACTIONS (list view header, for the selected lines)
+    def _lock_pending_received(self, action):
+        # Every selected line must be pending and sent to the current user. Checked in one query, locking the lines,
+        # so two users (or two clicks) can't receive the same transfer twice
+        self.flush_recordset(["status_source", "status_destination", "sent_to"])
+        self.env.cr.execute(f"""
+            SELECT id FROM {self._table}
+             WHERE id IN %s AND sent_to = %s AND status_source = 'sent' AND status_destination = 'pending'
+             ORDER BY id
+               FOR UPDATE
+            """, [tuple(self.ids), self.env.uid])
+        if len(self.env.cr.fetchall()) != len(self):
+            raise ValidationError(f"Solo puedes {action} traspasos pendientes de recibir que te hayan enviado a ti. Revisa los traspasos seleccionados.")
+
+    def receive_transfers(self):
+        if not self:
+            return
+        self._lock_pending_received("recibir")
+
+        # One ledger update for every currency received (one journal move per line)
+        self.env["forexmanager.cashcount"].apply_moves(
+            [((rec.receiver_desk_id.id, rec.currency_id.id), rec.amount, rec) for rec in self],
+            "Al realizar el envío, la cantidad en ventanilla de destino no puede quedar en negativo.")
+
+        self.write({
+            "status_destination": "received",
+            "destination_time": datetime.datetime.now(),
+            })
+        notification(self, "Traspasos recibidos", f"Se recibieron {len(self)} traspasos correctamente. Se actualizó el saldo de la ventanilla de destino.",
+                     "success")
+
+    def reject_transfers(self):
+        if not self:
+            return
+        self._lock_pending_received("rechazar")
+        self.write({
+            "status_destination": "rejected",
+            "destination_time": datetime.datetime.now(),
+            })
+        notification(self, "Traspasos rechazados", f"Se rechazaron {len(self)} traspasos correctamente.",
+                     "success")
@@ -1,4 +1,4 @@
-from odoo import fields, models
+from odoo import fields, models, api, tools
 
 
 class Users(models.Model):
@@ -9,4 +9,29 @@ class Users(models.Model):
 
     # ADDED FIELDS TO RES.USERS
     current_desk_id = fields.Many2one("forexmanager.desk")
-    opening_desk_id = fields.Many2one("forexmanager.desk")
\ No newline at end of file
+    opening_desk_id = fields.Many2one("forexmanager.desk")
+
+    # Only one user can be checked in (balance counted) in a desk. NULLs are not compared, so many users can have no desk
+    _sql_constraints = [
+        ("opening_desk_unique", "UNIQUE(opening_desk_id)", "Ya esta ventanilla tiene otro usuario arqueado."),
+    ]
+
+
+    # Desk -> user checked in there (id or False). Cached until the opening desk of any user changes
+    @api.model
+    @tools.ormcache("desk_id")
+    def _get_desk_user(self, desk_id):
+        return self.sudo().search([("opening_desk_id", "=", desk_id)], limit=1).id
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        users = super().create(vals_list)
+        if any(vals.get("opening_desk_id") for vals in vals_list):
+            self.env.registry.clear_cache() # Desk occupancy changed
+        return users
+
+    def write(self, vals):
+        res = super().write(vals)
+        if "opening_desk_id" in vals:
+            self.env.registry.clear_cache() # Desk occupancy changed
+        return res
@@ -1,10 +1,14 @@
 from odoo import fields, models, api
 from odoo.exceptions import ValidationError
 import datetime
-from ..utils import notification, get_base_rate
+from ..utils import notification
 from decimal import Decimal, ROUND_HALF_UP
 
 
+OPEN_SESSIONS_KEY = "forexmanager.worksession.open" # Per transaction cache of get_open_session()
+SESSION_FIELDS = {"user_id", "desk_id", "opening_desk_id", "session_type", "session_status"} # Writing them drops the cache
+
+
 class WorkSession(models.Model):
     """A model for creating the work sessions."""
 
@@ -95,6 +99,48 @@ class WorkSession(models.Model):
             "context": {"default_user_view": True},
         }
 
+    def init(self):
+        # Lookup of the open checkin session of a user (and desk), done on every form and onchange at the counter
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS forexmanager_worksession_open_idx
+                ON forexmanager_worksession (user_id, desk_id, session_type, session_status)
+            """)
+
+    # SESSION RESOLVER. Open checkin session of a user in a desk (or the first one opened by the user if no desk is given),
+    # shared by operations, transfers and the session checks. The result is kept for the current transaction
+    # and dropped as soon as a session is opened or closed (see create() and write())
+    @api.model
+    def get_open_session(self, user_id, desk_id=None):
+        cache = self.env.cr.precommit.data.setdefault(OPEN_SESSIONS_KEY, {}) # Cleared on commit and on rollback
+        key = (user_id, desk_id)
+        if key not in cache:
+            domain = [
+                ("user_id", "=", user_id),
+                ("session_type", "=", "checkin"),
+                ("session_status", "=", "open"),
+                ]
+            if desk_id:
+                domain.append(("desk_id", "=", desk_id))
+            cache[key] = self.search(domain, limit=1, order="id").id
+        return self.browse(cache[key])
+
+    # Checkin session of the user who opened (and counted) this desk. Transfers can only be sent to these desks
+    @api.model
+    def get_opening_session(self, desk_id):
+        cache = self.env.cr.precommit.data.setdefault(OPEN_SESSIONS_KEY, {})
+        key = (None, desk_id)
+        if key not in cache:
+            cache[key] = self.search([
+                ("opening_desk_id", "=", desk_id),
+                ("desk_id", "=", desk_id),
+                ("session_type", "=", "checkin"),
+                ("session_status", "=", "open"),
+                ], limit=1, order="id").id
+        return self.browse(cache[key])
+
+    def _invalidate_open_sessions(self):
+        self.env.cr.precommit.data.pop(OPEN_SESSIONS_KEY, None)
+
     @api.depends("saved_difference_checkbalance_ids")
     def _compute_saved_difference_checkbalance_ids(self):
         for rec in self:
@@ -116,9 +162,9 @@ class WorkSession(models.Model):
                     amount = Decimal(checkbalance.saved_difference).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
                     currency_base_id = currency_id.currency_base_id
                     
-                    base_rate = Decimal(get_base_rate(
-                                                    from_currency=currency_id.initials, 
-                                                    to_currency=currency_base_id.name)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP
+                    base_rate = Decimal(self.env["forexmanager.rate"].get_rate(
+                                                    currency_id.initials, 
+                                                    currency_base_id.name)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP
                                         ) if currency_id.initials != currency_base_id.name else 1
                     
                     value = float(Decimal(amount * base_rate).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
@@ -197,11 +243,7 @@ class WorkSession(models.Model):
             # Check if there is a pending balance check in the opening session before the end session check balance
             if self.session_type == "checkout":
                 # If there is a pending transfer in to opening_desk, exit checkbalance is not allowed
-                pending_transfer = self.env["forexmanager.transfer.line"].search([
-                    ("receiver_desk_id", "=", self.opening_desk_id),
-                    ("status_destination", "=", "pending")
-                    ], limit=1)
-                if pending_transfer:
+                if self.env["forexmanager.transfer.line"].has_pending(self.opening_desk_id.id):
                     raise ValidationError("No puedes lanzar el arqueo de salida mientras tengas un traspaso pendiente por recibir.")
 
                 if not self.session_to_close.balances_checked_ended:
@@ -249,13 +291,9 @@ class WorkSession(models.Model):
             # Save the difference
             rec.saved_difference = rec.difference
             # Update balance for this currency in this desk in cashcount
-            cashcount = self.env["forexmanager.cashcount"].search([
-                ("desk_id", "=", rec.desk_id.id),
-                ("currency_id", "=", rec.currency_id.id)
-                ])
-            cashcount.write({
-                "balance": rec.physical_balance,
-                })
+            self.env["forexmanager.cashcount"].set_balances({
+                (rec.desk_id.id, rec.currency_id.id): rec.physical_balance,
+                }, origin=rec)
             # Restarts the difference
             rec.difference = 0 # So it dissapears from view (page difference_checkbalance_ids)
             rec.confirmed = True
@@ -279,16 +317,11 @@ class WorkSession(models.Model):
         # The operation in secondary desks will discount or add balance to the opening desk balance.
 
         # Check if this is the first open session for this users (if not, then this is a temporary desk)
-        open_session = self.env["forexmanager.worksession"].search([
-                    ("user_id", "=", vals["user_id"]),
-                    ("session_type", "=", "checkin"),
-                    ("session_status", "=", "open")
-                    ], limit=1)
+        open_session = self.get_open_session(vals["user_id"])
         if not open_session: # Means this is the opening desk for this user
             # First, lets check if somebody else is checked-in in this desk
-            busy_desk = self.env["res.users"].search([
-                    ("opening_desk_id", "=", vals["desk_id"])
-                    ], limit=1)
+            # (the database also rejects a second user, see res.users opening_desk_unique)
+            busy_desk = self.env["res.users"]._get_desk_user(vals["desk_id"])
             if busy_desk and vals["session_type"] == "checkin":
                 raise ValidationError("Debes arquearte en otra ventanilla. Ya esta ventanilla tiene otro usuario arqueado.")
 
@@ -299,12 +332,7 @@ class WorkSession(models.Model):
                 })            
 
         # Check if there is already an open session for same user in the same desk_id
-        user_in_desk = self.env["forexmanager.worksession"].search([
-                    ("user_id", "=", vals["user_id"]),
-                    ("desk_id", "=", vals["desk_id"]),
-                    ("session_type", "=", "checkin"),
-                    ("session_status", "=", "open")
-                    ], limit=1)       
+        user_in_desk = self.get_open_session(vals["user_id"], vals["desk_id"])
         
         if vals["session_type"] == "checkin":
             if user_in_desk:
@@ -322,6 +350,7 @@ class WorkSession(models.Model):
                 vals["opening_desk_id"] = user_in_desk.opening_desk_id.id
             
         worksession = super().create(vals)
+        self._invalidate_open_sessions()
         
         if worksession.session_type == "checkout" and worksession.session_to_close:
             # Vinculate opening and closing session
@@ -345,17 +374,14 @@ class WorkSession(models.Model):
         return worksession
 
     def write(self, vals):
+        if SESSION_FIELDS.intersection(vals):
+            self._invalidate_open_sessions()
         for rec in self:
             worksession = super().write(vals)
 
             if rec.session_type == "checkout" and rec.session_to_close and rec.session_status == "open":                
                 # If it's the opening_desk, this session and opening session are closed after confirm balances
-                opening_session = self.env["forexmanager.worksession"].search([
-                    ("user_id", "=", rec.user_id.id),
-                    ("desk_id", "=", rec.desk_id.id),
-                    ("session_type", "=", "checkin"),
-                    ("session_status", "=", "open")
-                    ], limit=1) 
+                opening_session = self.get_open_session(rec.user_id.id, rec.desk_id.id)
 
                 if rec.opening_desk_id == rec.desk_id:
                     if rec.balances_checked_ended:
@@ -388,3 +414,7 @@ class WorkSession(models.Model):
                             })
                         
         return worksession
+
+    def unlink(self):
+        self._invalidate_open_sessions() # A deleted session must not be returned by get_open_session()
+        return super().unlink()
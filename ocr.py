@@ -0,0 +1,243 @@
+# MRZ reading of identity documents, out of the Odoo workers (no ORM access).
+# The reader runs in helper processes (this same file run as a script) fed through stdin/stdout,
+# so an OCR run never blocks an HTTP worker and the imaging stack is never loaded into Odoo.
+import base64
+import json
+import os
+import select
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from queue import Queue, Empty
+
+
+OCR_TIMEOUT = 60 # Seconds a helper may spend on one image
+MAX_TASKS_PER_HELPER = 50 # Images read before a helper is replaced, so the memory held by the imaging stack is given back
+MIN_VALID_SCORE = 50 # Below this the reading is not reliable
+MAX_SIDE = 2000 # Pixels of the longer side: a passport page (125 mm) at ~300 DPI plus some background
+TARGET_DPI = 300
+MRZ_MIN_HEIGHT = 0.04 # Minimum height of the MRZ band (fraction of the image height)
+MRZ_LINE_GAP = 0.03 # Maximum gap between two lines of the MRZ (fraction of the image height)
+MRZ_MARGIN = 0.03 # Margin added around the MRZ band (fraction of the image height)
+
+
+# PREPROCESSING STAGES. Every stage takes and returns a PIL image, so they can be replaced,
+# reordered or extended by passing other stages to read_document()
+
+def decode(image_bytes):
+    # Decode once. JPEG photos are decoded directly at reduced size and in grayscale
+    from PIL import Image, ImageOps
+
+    image = Image.open(BytesIO(image_bytes))
+    image.draft("L", (MAX_SIDE, MAX_SIDE))
+    return ImageOps.exif_transpose(image) # Phone photos are often stored rotated
+
+def downscale(image):
+    from PIL import Image
+
+    dpi = image.info.get("dpi", (0, 0))[0]
+    if dpi and dpi > TARGET_DPI:
+        scale = TARGET_DPI / dpi
+    else:
+        scale = MAX_SIDE / max(image.size)
+    if scale >= 1:
+        return image
+    return image.resize((round(image.width * scale), round(image.height * scale)), Image.BILINEAR)
+
+def grayscale(image):
+    return image if image.mode == "L" else image.convert("L")
+
+STAGES = (downscale, grayscale)
+
+
+def crop_mrz_band(image):
+    # Locates the MRZ (two or three dense lines of text at the bottom of the document) with the
+    # per-row edge density. Returns the cropped band, or None if it can't be found
+    from PIL import Image, ImageFilter
+
+    height = min(image.height, 400)
+    small = image.resize((max(1, round(image.width * height / image.height)), height), Image.BILINEAR)
+    edges = small.filter(ImageFilter.FIND_EDGES)
+    profile = list(edges.resize((1, height), Image.BOX).tobytes()) # Mean edge density of every row (mode L: one byte)
+    profile[:2] = profile[-2:] = [0, 0] # The image borders are always detected as edges
+    mean = sum(profile) / height
+    std = (sum((value - mean) ** 2 for value in profile) / height) ** 0.5
+    threshold = mean + 0.5 * std
+
+    # Rows of text, closing the gaps between the lines of the MRZ
+    gap = max(1, round(MRZ_LINE_GAP * height))
+    dense = [max(profile[max(0, row - gap):row + gap + 1]) > threshold for row in range(height)]
+
+    # Lowest dense block of rows in the lower half of the image
+    end = start = None
+    for row in range(height - 1, height // 2 - 1, -1):
+        if dense[row]:
+            if end is None:
+                end = row
+            start = row
+        elif end is not None:
+            break
+    if end is None or end - start + 1 < MRZ_MIN_HEIGHT * height:
+        return None
+
+    margin = MRZ_MARGIN * height
+    scale = image.height / height
+    top = max(0, round((start - margin) * scale))
+    bottom = min(image.height, round((end + 1 + margin) * scale))
+    return image.crop((0, top, image.width, bottom))
+
+
+def preprocess(image_bytes, stages=STAGES):
+    image = decode(image_bytes)
+    for stage in stages:
+        image = stage(image)
+    return image
+
+
+def _read_mrz(image):
+    from passporteye import read_mrz
+
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    buffer.seek(0)
+    return read_mrz(buffer)
+
+
+def read_document(image_bytes, stages=STAGES, locator=crop_mrz_band):
+    # Runs in the helper process. Returns the MRZ as a dict, or None if no MRZ was found.
+    # The MRZ band is read first; the whole image only if the band is not found or not reliable
+    image = preprocess(image_bytes, stages)
+    mrz = None
+    band = locator(image) if locator else None
+    if band is not None:
+        mrz = _read_mrz(band)
+    if mrz is None or mrz.valid_score <= MIN_VALID_SCORE:
+        full = _read_mrz(image)
+        if full is not None and (mrz is None or full.valid_score > mrz.valid_score):
+            mrz = full
+    return mrz.to_dict() if mrz is not None else None
+
+
+class _Helper:
+    """One helper process reading documents, one request at a time."""
+
+    def __init__(self):
+        self.tasks = 0
+        self.process = subprocess.Popen(
+            [sys.executable, __file__],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            )
+
+    def read(self, image_bytes, timeout=OCR_TIMEOUT):
+        request = json.dumps({"image": base64.b64encode(image_bytes).decode()})
+        self.process.stdin.write(request.encode() + b"\n")
+        self.process.stdin.flush()
+        self.tasks += 1
+        response = json.loads(self._read_line(timeout))
+        if not response["ok"]:
+            raise RuntimeError(response["error"])
+        return response["mrz"]
+
+    def _read_line(self, timeout):
+        # Response line, waiting at most timeout seconds. A helper that doesn't answer in time is killed
+        # (the pool starts a new one for the next request)
+        fd = self.process.stdout.fileno()
+        deadline = time.monotonic() + timeout
+        chunks = []
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                self.process.kill()
+                self.process.wait()
+                raise TimeoutError("La lectura del documento superó el tiempo máximo.")
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise RuntimeError("El proceso de lectura de documentos terminó inesperadamente.")
+            chunks.append(chunk)
+            if chunk.endswith(b"\n"):
+                return b"".join(chunks)
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def close(self):
+        if self.alive():
+            self.process.stdin.close()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+class OCRPool:
+    """A pool of helper processes. submit() returns a Future with the MRZ dict (or None)."""
+
+    def __init__(self, workers=2, max_tasks=MAX_TASKS_PER_HELPER):
+        self.workers = workers
+        self.max_tasks = max_tasks
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="forexmanager-ocr")
+        self._helpers = Queue()
+
+    def submit(self, image_bytes):
+        return self._executor.submit(self._read, image_bytes)
+
+    def _read(self, image_bytes):
+        try:
+            helper = self._helpers.get_nowait()
+        except Empty:
+            helper = _Helper()
+        if not helper.alive():
+            helper = _Helper()
+
+        try:
+            result = helper.read(image_bytes)
+        except Exception:
+            helper.close() # Don't reuse a helper in an unknown state
+            raise
+        if self.max_tasks and helper.tasks >= self.max_tasks:
+            helper.close() # Recycled: the next request starts a fresh one
+        else:
+            self._helpers.put(helper)
+        return result
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+        while not self._helpers.empty():
+            self._helpers.get_nowait().close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(workers):
+    # One pool per Odoo worker process, created on first use
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.workers != workers:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = OCRPool(workers)
+        return _pool
+
+
+def _serve():
+    # Helper process loop: one JSON request per line on stdin, one JSON response per line on stdout
+    out = sys.stdout
+    sys.stdout = sys.stderr # Anything printed by the OCR libraries must not break the protocol
+    for line in sys.stdin:
+        try:
+            image_bytes = base64.b64decode(json.loads(line)["image"])
+            response = {"ok": True, "mrz": read_document(image_bytes)}
+        except Exception as e:
+            response = {"ok": False, "error": str(e)}
+        out.write(json.dumps(response, default=str) + "\n")
+        out.flush()
+
+
+if __name__ == "__main__":
+    _serve()
@@ -0,0 +1,211 @@
+# Pure Python pricing core (no ORM access). Amounts are handled in integer cents.
+# The calculation model is a thin adapter over these functions, and they can also be used in batch (price_many())
+from dataclasses import dataclass
+from decimal import Decimal, ROUND_HALF_UP
+from math import gcd
+
+_numpy = None
+
+
+MARGIN = 1.4 # Commercial margin over the base rate (official rate)
+
+
+def to_cents(amount):
+    # Float amount to integer cents (rounding half up, as Decimal.quantize(ROUND_HALF_UP))
+    return int(Decimal(str(amount)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP) * 100)
+
+
+def rate_fraction(rate, inverse=False):
+    # Exact (numerator, denominator) of a rate with 6 decimals (as stored in calculation). inverse means 1 / rate
+    numerator, denominator = Decimal(str(rate)).quantize(Decimal("0.000001"), rounding=ROUND_HALF_UP).as_integer_ratio()
+    return (denominator, numerator) if inverse else (numerator, denominator)
+
+
+def _first_in_range(a, m, low, high):
+    # Smallest x >= 0 such that low <= (a * x) % m <= high (0 <= low <= high < m). None if there is no solution.
+    # Euclid-like recursion: O(log m) steps
+    a %= m
+    if low == 0:
+        return 0
+    if a == 0:
+        return None
+    x = -(-low // a)
+    if a * x <= high:
+        return x
+    # [low, high] is between two multiples of a: look for the smallest y with (-m * y) % a in [low % a, high % a],
+    # that is (m * y) % a in [a - high % a, a - low % a]
+    y = _first_in_range(m % a, a, a - high % a, a - low % a)
+    if y is None:
+        return None
+    return -(-(low + m * y) // a)
+
+
+def _first_step(start, step, modulus, width):
+    # Smallest t >= 0 such that (start + step * t) % modulus < width
+    if start % modulus < width:
+        return 0
+    low = (-start) % modulus
+    high = low + width - 1
+    if high < modulus:
+        return _first_in_range(step, modulus, low, high)
+    candidates = [_first_in_range(step, modulus, low, modulus - 1), _first_in_range(step, modulus, 0, high - modulus)]
+    candidates = [t for t in candidates if t is not None]
+    return min(candidates) if candidates else None
+
+
+def nearest_payable_pairs(cents, from_values, to_values, rate, inverse=False):
+    # Nearest pairs (from_cents, to_cents) under and over the given amount (cents, in "from" currency), where both
+    # amounts can be paid with the accepted bills and coins and to_cents = round(from_cents * rate) (or / rate
+    # if inverse). Instead of snapping both currencies in turns, it solves the lattice condition directly:
+    #   from = k * a (a = gcd of from_values), to = round(k * a * num / den) must be a multiple of b (gcd of to_values)
+    #   <=> (2 * k * a * num + den) % (2 * b * den) < 2 * den
+    # The smallest step that satisfies it is found with _first_in_range() in O(log) steps, so it always terminates.
+    # Returns ((from_under, to_under), (from_over, to_over))
+    a = gcd(*from_values)
+    b = gcd(*to_values)
+    num, den = rate_fraction(rate, inverse)
+    modulus = 2 * b * den
+    step = (2 * a * num) % modulus
+    width = 2 * den
+
+    def convert(k):
+        return k * a, (2 * k * a * num + den) // (2 * den)
+
+    # Under: largest k <= k_under (k = 0 is always valid)
+    k_under = cents // a
+    t = _first_step(2 * k_under * a * num + den, (modulus - step) % modulus, modulus, width)
+    k = k_under - t if t is not None and t <= k_under else 0
+    under = convert(k)
+
+    # Over: smallest k >= k_over (k = multiple of the period is always valid)
+    k_over = -(-cents // a)
+    t = _first_step(2 * k_over * a * num + den, step, modulus, width)
+    over = convert(k_over + t)
+
+    return under, over
+
+
+def payable_pairs(typed, cents, source_values, target_values, buy_rate, sell_rate, source_is_base):
+    # nearest_payable_pairs() for a calculation line. typed is the amount the user typed ("received" or "delivered").
+    # Returns ((received_under, delivered_under), (received_over, delivered_over)) in cents, or None without rates
+    if typed == "received":
+        # delivered = received * buy_rate if client offers base_currency, else received / sell_rate
+        rate, inverse = (buy_rate, False) if source_is_base else (sell_rate, True)
+        if not rate:
+            return None
+        return nearest_payable_pairs(cents, source_values, target_values, rate, inverse)
+
+    # received = delivered * sell_rate if client buys base_currency, else delivered / buy_rate
+    rate, inverse = (buy_rate, True) if source_is_base else (sell_rate, False)
+    if not rate:
+        return None
+    under, over = nearest_payable_pairs(cents, target_values, source_values, rate, inverse)
+    return under[::-1], over[::-1]
+
+
+def compute_rates(base_rate, discount, margin=MARGIN):
+    # (buy_rate, sell_rate) for a base rate. Discount (0-100) is applied to the difference between
+    # base and commercial rate
+    sell_rate = base_rate + (base_rate * margin - base_rate) * ((100 - discount) / 100)
+    buy_rate = base_rate - (base_rate - base_rate / margin) * ((100 - discount) / 100)
+    return buy_rate, sell_rate
+
+
+@dataclass(slots=True, frozen=True)
+class QuoteRequest:
+    """A request to price one exchange line."""
+
+    base_rate: float # From base currency to the foreign currency
+    discount: int = 0
+    source_is_base: bool = True # True if the client offers the base currency
+    typed: str = "received" # Which amount is given ("received" or "delivered")
+    cents: int = 0
+    source_values: tuple = () # Accepted bills and coins (cents). Without them, amounts are not adjusted
+    target_values: tuple = ()
+
+
+@dataclass(slots=True, frozen=True)
+class Quote:
+    """The price of one exchange line (amounts in cents)."""
+
+    buy_rate: float
+    sell_rate: float
+    received_under: int = 0
+    delivered_under: int = 0
+    received_over: int = 0
+    delivered_over: int = 0
+
+
+def price(request, margin=MARGIN):
+    return price_many([request], margin)[0]
+
+
+def price_many(requests, margin=MARGIN):
+    # Price any number of requests in one call. Rates are computed once for every (base_rate, discount)
+    rates = {}
+    quotes = []
+    for request in requests:
+        key = (request.base_rate, request.discount)
+        if key not in rates:
+            rates[key] = compute_rates(request.base_rate, request.discount, margin)
+        buy_rate, sell_rate = rates[key]
+
+        pairs = None
+        if request.cents and request.source_values and request.target_values:
+            pairs = payable_pairs(request.typed, request.cents, request.source_values, request.target_values,
+                                  buy_rate, sell_rate, request.source_is_base)
+        if pairs:
+            (received_under, delivered_under), (received_over, delivered_over) = pairs
+            quotes.append(Quote(buy_rate, sell_rate, received_under, delivered_under, received_over, delivered_over))
+        else:
+            quotes.append(Quote(buy_rate, sell_rate))
+    return quotes
+
+
+def _load_numpy():
+    # numpy is only imported the first time a rate board is built, so loading the module (every Odoo worker)
+    # doesn't pay for it. Pricing must work without it too
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _numpy = numpy
+    return _numpy or None
+
+
+def rate_board(base_rates, discounts, margin=MARGIN):
+    # Buy and sell rates for every base rate (rows) at every discount (columns) in one vectorized pass.
+    # Returns (buy, sell) as lists of rows
+    np = _load_numpy()
+    if np is not None:
+        base = np.asarray(base_rates, dtype=float)[:, None]
+        factor = ((100 - np.asarray(discounts, dtype=float)) / 100)[None, :]
+        sell = base + (base * margin - base) * factor
+        buy = base - (base - base / margin) * factor
+        return buy.tolist(), sell.tolist()
+
+    rows = [[compute_rates(base, discount, margin) for discount in discounts] for base in base_rates]
+    return [[rate[0] for rate in row] for row in rows], [[rate[1] for rate in row] for row in rows]
+
+
+def summarize(lines):
+    # Totals of an operation. lines: iterable of (source currency, amount received, target currency, amount delivered).
+    # Returns {"receive": {currency: amount}, "deliver": {currency: amount}, "diff": {currency: {"receive": x, "deliver": y}}}
+    # where diff is the net per currency (a currency received and delivered only shows the difference)
+    receive, deliver = {}, {}
+    for source, received, target, delivered in lines:
+        receive[source] = receive.get(source, Decimal("0")) + Decimal(str(received or 0))
+        deliver[target] = deliver.get(target, Decimal("0")) + Decimal(str(delivered or 0))
+
+    diff = {}
+    for currency in list(receive) + [c for c in deliver if c not in receive]:
+        net = receive.get(currency, Decimal("0")) - deliver.get(currency, Decimal("0"))
+        diff[currency] = {"receive": float(max(net, 0)), "deliver": float(max(-net, 0))}
+
+    return {
+        "receive": {currency: float(amount) for currency, amount in receive.items()},
+        "deliver": {currency: float(amount) for currency, amount in deliver.items()},
+        "diff": diff,
+        }
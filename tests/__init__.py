@@ -0,0 +1,8 @@
+from . import test_pricing
+from . import test_rate_board
+from . import test_rate_quote
+from . import test_cashcount_ledger
+from . import test_cashcount_journal
+from . import test_passport
+from . import test_transfers
+from . import test_customer_dedup
@@ -0,0 +1,66 @@
+from odoo import Command
+from odoo.tests import TransactionCase, new_test_user
+
+
+class ForexmanagerCase(TransactionCase):
+    """USD (base EUR) with a rate already stored, so no test calls the rates API. One workcenter
+    accepting it, with three desks and one teller for each desk."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.eur = cls.env.ref("base.EUR")
+        cls.usd = cls.env.ref("base.USD")
+        (cls.eur | cls.usd).active = True
+
+        Rate = cls.env["forexmanager.rate"]
+        cls.currency = cls.env["forexmanager.currency"].create({
+            "currency_base_id": cls.eur.id,
+            "currency_id": cls.usd.id,
+            "rate_id": Rate.create({
+                "base_currency_id": cls.eur.id,
+                "currency_id": cls.usd.id,
+                "rate": 1.1,
+                "version": Rate._next_version(),
+                }).id,
+            "unit_ids": [Command.create({"unit": "bill", "value": value}) for value in (5, 10, 20, 50)],
+            })
+        cls.workcenter = cls.env["forexmanager.workcenter"].create({
+            "name": "Centro de pruebas",
+            "currency_ids": [Command.set(cls.currency.ids)],
+            })
+        # Desk.create() opens the inventories (cashcount, balance 0) of the workcenter currencies
+        cls.desk_a, cls.desk_b, cls.desk_c = [cls.env["forexmanager.desk"].create({
+            "name": f"Ventanilla {code}",
+            "desk_code": code,
+            "workcenter_id": cls.workcenter.id,
+            }) for code in ("A", "B", "C")]
+        cls.user_a, cls.user_b, cls.user_c = [new_test_user(
+            cls.env, login=f"teller_{code}", groups="base.group_user,forexmanager.group_forexmanager_user",
+            ) for code in ("a", "b", "c")]
+
+    @classmethod
+    def cashcount(cls, desk):
+        return cls.env["forexmanager.cashcount"].search([
+            ("desk_id", "=", desk.id),
+            ("currency_id", "=", cls.currency.id),
+            ])
+
+    @classmethod
+    def open_session(cls, user, desk):
+        # Checkin session with the balance check already done, as after confirm_balances()
+        session = cls.env["forexmanager.worksession"].create({
+            "user_id": user.id,
+            "desk_id": desk.id,
+            "session_type": "checkin",
+            })
+        session.balances_checked_ended = True
+        return session
+
+    def key(self, desk):
+        return (desk.id, self.currency.id)
+
+    def balance(self, desk):
+        cashcount = self.cashcount(desk)
+        cashcount.invalidate_recordset(["balance"])
+        return cashcount.balance
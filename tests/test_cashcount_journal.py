@@ -0,0 +1,86 @@
+from datetime import timedelta
+from odoo import fields
+from odoo.exceptions import ValidationError
+from odoo.tests import tagged
+from .common import ForexmanagerCase
+
+
+@tagged("post_install", "-at_install")
+class TestCashcountJournal(ForexmanagerCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Cashcount = cls.env["forexmanager.cashcount"]
+        cls.cashcount(cls.desk_a).balance = 100 # Journaled as an adjustment
+
+    def moves(self, desk):
+        return self.env["forexmanager.cashcount.move"].search([
+            ("desk_id", "=", desk.id),
+            ("currency_id", "=", self.currency.id),
+            ], order="id")
+
+    def test_deltas_are_journaled(self):
+        self.Cashcount.apply_deltas({
+            self.key(self.desk_a): -30.25,
+            self.key(self.desk_b): 10,
+            }, origin=self.desk_c)
+
+        moves = self.moves(self.desk_a)
+        self.assertEqual(moves.mapped("delta_cents"), [10000, -3025])
+        self.assertEqual(moves[-1].amount, -30.25)
+        self.assertEqual((moves[-1].res_model, moves[-1].res_id), ("forexmanager.desk", self.desk_c.id))
+        self.assertEqual(self.moves(self.desk_b).mapped("delta_cents"), [1000])
+        # The journal adds up to the balance
+        self.assertEqual(sum(moves.mapped("delta_cents")) / 100, self.balance(self.desk_a))
+
+    def test_moves_of_several_origins(self):
+        # Same desk/currency from two records: the row is updated once, every record gets its own move
+        self.Cashcount.apply_moves([
+            (self.key(self.desk_a), 5, self.desk_b),
+            (self.key(self.desk_a), 7.5, self.desk_c),
+            ])
+
+        self.assertEqual(self.balance(self.desk_a), 112.5)
+        moves = self.moves(self.desk_a)[1:]
+        self.assertEqual(moves.mapped("delta_cents"), [500, 750])
+        self.assertEqual(moves.mapped("res_id"), [self.desk_b.id, self.desk_c.id])
+
+    def test_rejected_deltas_are_not_journaled(self):
+        with self.assertRaises(ValidationError):
+            self.Cashcount.apply_deltas({self.key(self.desk_a): -150})
+        self.assertEqual(len(self.moves(self.desk_a)), 1)
+
+    def test_balance_edit_is_journaled(self):
+        self.cashcount(self.desk_a).balance = 80
+        self.assertEqual(self.moves(self.desk_a).mapped("delta_cents"), [10000, -2000])
+        self.assertEqual(self.balance(self.desk_a), 80)
+
+    def test_moves_are_append_only(self):
+        move = self.moves(self.desk_a)
+        with self.assertRaises(ValidationError):
+            move.write({"delta_cents": 0})
+        with self.assertRaises(ValidationError):
+            move.unlink()
+
+    def test_balance_at(self):
+        # Yesterday's moves are closed in a checkpoint, today's are added from the journal
+        yesterday = fields.Datetime.now() - timedelta(days=1)
+        self.env.flush_all()
+        self.env.cr.execute("UPDATE forexmanager_cashcount_move SET date = %s WHERE desk_id = %s", [yesterday, self.desk_a.id])
+        self.env.invalidate_all()
+        self.env["forexmanager.cashcount.checkpoint"]._cron_create_checkpoints()
+        checkpoint = self.env["forexmanager.cashcount.checkpoint"].search([("desk_id", "=", self.desk_a.id)])
+        self.assertEqual(checkpoint.balance_cents, 10000)
+        self.assertEqual(checkpoint.move_id, self.moves(self.desk_a))
+
+        self.Cashcount.apply_deltas({self.key(self.desk_a): 25})
+        self.assertEqual(self.Cashcount.balance_at(self.desk_a.id)[self.currency.id], 125)
+        self.assertEqual(self.Cashcount.balance_at(self.desk_a.id, yesterday)[self.currency.id], 100)
+        self.assertEqual(self.Cashcount.balance_at(self.desk_a.id, yesterday - timedelta(hours=1)), {})
+
+        # A second checkpoint only adds the moves after the first one
+        self.env["forexmanager.cashcount.checkpoint"]._cron_create_checkpoints()
+        checkpoints = self.env["forexmanager.cashcount.checkpoint"].search([("desk_id", "=", self.desk_a.id)], order="move_id")
+        self.assertEqual(checkpoints.mapped("balance_cents"), [10000, 12500])
+        self.assertEqual(self.Cashcount.balance_at(self.desk_a.id)[self.currency.id], 125)
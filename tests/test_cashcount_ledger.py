@@ -0,0 +1,47 @@
+from odoo.exceptions import ValidationError
+from odoo.tests import tagged
+from .common import ForexmanagerCase
+
+
+@tagged("post_install", "-at_install")
+class TestCashcountLedger(ForexmanagerCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Cashcount = cls.env["forexmanager.cashcount"]
+        cls.cashcount(cls.desk_a).balance = 100
+        cls.cashcount(cls.desk_b).balance = 50
+
+    def test_batched_deltas(self):
+        balances = self.Cashcount.apply_deltas({
+            self.key(self.desk_a): -30.25,
+            self.key(self.desk_b): 10,
+            self.key(self.desk_c): 0,
+            })
+
+        self.assertEqual(balances, {self.key(self.desk_a): 69.75, self.key(self.desk_b): 60})
+        self.assertEqual(self.balance(self.desk_a), 69.75)
+        self.assertEqual(self.balance(self.desk_b), 60)
+        self.assertEqual(self.balance(self.desk_c), 0)
+
+    def test_negative_balance_guard(self):
+        with self.assertRaises(ValidationError) as error: # Rolls back to a savepoint, as the request would
+            self.Cashcount.apply_deltas({
+                self.key(self.desk_a): -100.01,
+                self.key(self.desk_b): 5,
+                }, "No puede quedar en negativo")
+        self.assertEqual(str(error.exception), "No puede quedar en negativo")
+
+        # Nothing of the batch is applied
+        self.assertEqual(self.balance(self.desk_a), 100)
+        self.assertEqual(self.balance(self.desk_b), 50)
+
+    def test_whole_balance_can_be_taken(self):
+        self.Cashcount.apply_deltas({self.key(self.desk_a): -100})
+        self.assertEqual(self.balance(self.desk_a), 0)
+
+    def test_missing_inventory(self):
+        self.cashcount(self.desk_c).unlink()
+        with self.assertRaises(ValidationError):
+            self.Cashcount.apply_deltas({self.key(self.desk_c): 10})
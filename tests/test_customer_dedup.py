@@ -0,0 +1,53 @@
+from odoo import Command
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged("post_install", "-at_install")
+class TestCustomerDedup(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.spain = cls.env.ref("base.es")
+        cls.france = cls.env.ref("base.fr")
+        cls.madrid = cls.env["res.country.state"].search([("country_id", "=", cls.spain.id)], limit=1)
+        # Only the customers created by each test are checked
+        cls.env["ir.config_parameter"].sudo().set_param(
+            "forexmanager.customer_dedup_last_id", cls.env["forexmanager.customer"].search([], order="id desc", limit=1).id or 0)
+
+    def _customer(self, first_name, ID_number, ID_country=None):
+        return self.env["forexmanager.customer"].create({
+            "first_name_1": first_name,
+            "last_name_1": "GARCIA",
+            "birth_country_id": self.spain.id,
+            "birth_date": "1980-01-01",
+            "sex": "female",
+            "country_id": self.spain.id,
+            "province_id": self.madrid.id,
+            "city": "Madrid",
+            "street": "Mayor",
+            "number": "1",
+            "passport_ids": [Command.create({
+                "ID_type": "p",
+                "ID_country": (ID_country or self.spain).id,
+                "nationality": self.spain.id,
+                "ID_expiration": "2030-01-01",
+                "ID_number": ID_number,
+                })],
+            })
+
+    def test_merge_same_document_number(self):
+        # Same passport number registered with another issuing country
+        master = self._customer("MARÍA", "PA123456")
+        duplicate = self._customer("MARIA", "pa-123456", self.france)
+        self.env["forexmanager.customer"]._cron_merge_duplicates()
+        self.assertFalse(duplicate.exists())
+        self.assertEqual(len(master.passport_ids), 2)
+
+    def test_similar_names_are_not_merged(self):
+        # Same birth date and nationality, similar names, but different documents: two people
+        maria = self._customer("MARIA", "PA123456")
+        mario = self._customer("MARIO", "PA654321")
+        self.env["forexmanager.customer"]._cron_merge_duplicates()
+        self.assertTrue(maria.exists())
+        self.assertTrue(mario.exists())
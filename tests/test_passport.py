@@ -0,0 +1,78 @@
+from psycopg2 import IntegrityError
+from odoo.tests import TransactionCase, tagged
+from odoo.tools import mute_logger
+
+
+@tagged("post_install", "-at_install")
+class TestPassport(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Passport = cls.env["forexmanager.passport"]
+        cls.spain = cls.env.ref("base.es")
+        cls.france = cls.env.ref("base.fr")
+        cls.passport = cls.Passport.create({
+            "ID_type": "p",
+            "ID_country": cls.spain.id,
+            "nationality": cls.spain.id,
+            "ID_expiration": "2030-01-01",
+            "ID_number": "pa 123<456",
+            })
+
+    def test_document_key(self):
+        self.assertEqual(self.passport.ID_number_normalized, "PA123456")
+        self.assertEqual(self.passport.document_key, "ES-p-PA123456")
+
+    def test_find_document_by_key(self):
+        # However the number was typed or read from the MRZ
+        for number in ("PA123456", "pa-123.456", "PA123456<<<"):
+            self.assertEqual(self.Passport.find_document(number, self.spain, "p"), self.passport)
+        self.assertFalse(self.Passport.find_document("PA123456", self.france, "p"))
+        self.assertFalse(self.Passport.find_document("PA123456", self.spain, "id"))
+        self.assertFalse(self.Passport.find_document("PA123457", self.spain, "p"))
+        self.assertFalse(self.Passport.find_document(False, self.spain, "p"))
+
+    def test_find_document_needs_country_and_type(self):
+        # The same number can belong to a document of another person
+        self.assertFalse(self.Passport.find_document("PA123456"))
+        self.assertFalse(self.Passport.find_document("PA123456", self.spain))
+        self.assertFalse(self.Passport.find_document("PA123456", ID_type="p"))
+
+    def test_same_document_twice(self):
+        with self.assertRaises(IntegrityError), mute_logger("odoo.sql_db"):
+            self.Passport.create({
+                "ID_type": "p",
+                "ID_country": self.spain.id,
+                "nationality": self.france.id,
+                "ID_expiration": "2031-01-01",
+                "ID_number": "PA123456",
+                })
+            self.env.flush_all()
+
+    def _mrz(self, **values):
+        # As returned by passporteye for a TD3 (passport) document
+        mrz = {
+            "valid_score": 100, "mrz_type": "TD3", "type": "P<", "country": "ESP", "number": "PA123456<",
+            "optional1": "", "expiration_date": "300101", "valid_expiration_date": True,
+            "names": "MARIA<<<<", "surname": "GARCIA<LOPEZ<<", "nationality": "ESP",
+            "date_of_birth": "800101", "valid_date_of_birth": True, "sex": "F",
+            }
+        mrz.update(values)
+        return mrz
+
+    def test_read_document_finds_customer(self):
+        operation = self.env["forexmanager.operation"].new({})
+        operation._apply_mrz_data(self._mrz())
+        self.assertEqual(operation.ID_type, "p")
+        self.assertEqual(operation.ID_country, self.spain)
+        self.assertEqual(operation.passport_id, self.passport)
+
+    def test_read_document_unknown_country(self):
+        # Nothing to look for: the teller is warned and the data read is kept to be completed
+        operation = self.env["forexmanager.operation"].new({})
+        operation._apply_mrz_data(self._mrz(country="XXX"))
+        self.assertFalse(operation.ID_country)
+        self.assertFalse(operation.passport_id)
+        self.assertFalse(operation.search_ID)
+        self.assertEqual(operation.first_name_1, "MARIA")
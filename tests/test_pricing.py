@@ -0,0 +1,61 @@
+import random
+from math import gcd
+from odoo.tests import BaseCase, tagged
+from ..pricing import nearest_payable_pairs, rate_fraction
+
+
+DENOMINATIONS = [
+    (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000), # EUR, every coin and bill
+    (500, 1000, 2000, 5000, 10000), # Only bills
+    (100, 200, 500, 1000),
+    (5, 10, 20, 50, 100),
+    (2000, 5000, 10000),
+    (1000,),
+    ]
+
+
+def brute_force_pairs(cents, from_values, to_values, rate, inverse=False):
+    # Same contract as nearest_payable_pairs(), walking k one by one
+    a = gcd(*from_values)
+    b = gcd(*to_values)
+    num, den = rate_fraction(rate, inverse)
+
+    def convert(k):
+        return k * a, (2 * k * a * num + den) // (2 * den)
+
+    k = cents // a
+    while k > 0 and convert(k)[1] % b:
+        k -= 1
+    under = convert(k)
+
+    k = -(-cents // a)
+    while convert(k)[1] % b:
+        k += 1
+    return under, convert(k)
+
+
+@tagged("post_install", "-at_install")
+class TestNearestPayablePairs(BaseCase):
+
+    def test_against_brute_force(self):
+        rnd = random.Random(2024)
+        for _ in range(3000):
+            from_values, to_values = rnd.choice(DENOMINATIONS), rnd.choice(DENOMINATIONS)
+            rate = round(rnd.uniform(0.001, 200), 6)
+            inverse = rnd.random() < 0.5
+            cents = rnd.randint(0, 500000)
+            with self.subTest(cents=cents, from_values=from_values, to_values=to_values, rate=rate, inverse=inverse):
+                self.assertEqual(nearest_payable_pairs(cents, from_values, to_values, rate, inverse),
+                                 brute_force_pairs(cents, from_values, to_values, rate, inverse))
+
+    def test_pairs_are_payable(self):
+        (from_under, to_under), (from_over, to_over) = nearest_payable_pairs(12345, (500, 1000), (1000,), 1.0865)
+        self.assertLessEqual(from_under, 12345)
+        self.assertGreaterEqual(from_over, 12345)
+        for from_cents, to_cents in ((from_under, to_under), (from_over, to_over)):
+            self.assertEqual(from_cents % 500, 0)
+            self.assertEqual(to_cents % 1000, 0)
+
+    def test_exact_amount(self):
+        # 100.00 at rate 2 is already payable on both sides
+        self.assertEqual(nearest_payable_pairs(10000, (500,), (1000,), 2), ((10000, 20000), (10000, 20000)))
@@ -0,0 +1,42 @@
+from odoo.tests import tagged
+from .common import ForexmanagerCase
+from ..pricing import compute_rates
+
+
+@tagged("post_install", "-at_install")
+class TestRateBoard(ForexmanagerCase):
+
+    def publish_rate(self, rate):
+        # As the scheduled refresh does: a new snapshot version, linked to the currency
+        Rate = self.env["forexmanager.rate"]
+        self.currency.rate_id = Rate.create({
+            "base_currency_id": self.eur.id,
+            "currency_id": self.usd.id,
+            "rate": rate,
+            "version": Rate._next_version(),
+            })
+
+    def usd_row(self, board):
+        return next(row for row in board["rows"] if row["initials"] == "USD")
+
+    def test_board_cached_until_new_version(self):
+        Currency = self.env["forexmanager.currency"]
+        board = Currency.get_rate_board()
+        self.assertEqual(self.usd_row(board)["base_rate"], 1.1)
+        self.assertIs(Currency.get_rate_board(), board) # Same version: cached
+
+        self.publish_rate(1.2)
+        new_board = Currency.get_rate_board()
+        self.assertGreater(new_board["version"], board["version"])
+        self.assertEqual(self.usd_row(new_board)["base_rate"], 1.2)
+        self.assertNotEqual(self.usd_row(new_board)["buy"], self.usd_row(board)["buy"])
+        self.assertIs(Currency.get_rate_board(), new_board)
+
+    def test_board_rates(self):
+        # Same rates as pricing one by one (the board computes them all in one pass)
+        board = self.env["forexmanager.currency"].get_rate_board()
+        row = self.usd_row(board)
+        for i, discount in enumerate(board["discounts"]):
+            buy_rate, sell_rate = compute_rates(1.1, discount)
+            self.assertAlmostEqual(row["buy"][i], buy_rate, places=6)
+            self.assertAlmostEqual(row["sell"][i], sell_rate, places=6)
@@ -0,0 +1,27 @@
+from datetime import timedelta
+from odoo import fields
+from odoo.tests import tagged
+from .common import ForexmanagerCase
+
+
+@tagged("post_install", "-at_install")
+class TestRateQuote(ForexmanagerCase):
+
+    def test_issue_freezes_rates_at_quote_time(self):
+        RateQuote = self.env["forexmanager.rate.quote"]
+        now = fields.Datetime.now()
+        older = self.env["forexmanager.rate"].create({
+            "base_currency_id": self.eur.id,
+            "currency_id": self.usd.id,
+            "rate": 1.05,
+            "fetched_at": now - timedelta(hours=1),
+            })
+
+        self.assertEqual(RateQuote._issue(now - timedelta(minutes=30), self.currency).rate_ids, older)
+        self.assertEqual(RateQuote._issue(now, self.currency).rate_ids, self.currency.rate_id)
+        # No snapshot before the quote: the current one
+        self.assertEqual(RateQuote._issue(now - timedelta(hours=2), self.currency).rate_ids, self.currency.rate_id)
+
+    def test_issue_only_given_currencies(self):
+        quote = self.env["forexmanager.rate.quote"]._issue(fields.Datetime.now(), self.env["forexmanager.currency"])
+        self.assertFalse(quote.rate_ids)
@@ -0,0 +1,117 @@
+from odoo import Command
+from odoo.exceptions import ValidationError
+from odoo.tests import tagged
+from .common import ForexmanagerCase
+
+
+@tagged("post_install", "-at_install")
+class TestTransfers(ForexmanagerCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.session_a = cls.open_session(cls.user_a, cls.desk_a)
+        cls.session_b = cls.open_session(cls.user_b, cls.desk_b)
+        cls.session_c = cls.open_session(cls.user_c, cls.desk_c)
+        cls.cashcount(cls.desk_a).balance = 100
+
+    def send(self, *lines):
+        return self.env["forexmanager.transfer"].with_user(self.user_a).send_lines([{
+            "receiver_desk_id": desk.id,
+            "currency_id": self.currency.id,
+            "amount": amount,
+            } for desk, amount in lines], self.session_a.id, self.session_a.id)
+
+    def test_send_lines(self):
+        transfers = self.send((self.desk_b, 30), (self.desk_c, 15), (self.desk_b, 20))
+
+        # One transfer per receiver desk, every amount taken from the sender at once
+        self.assertEqual(sorted(len(t.transfer_line_ids) for t in transfers), [1, 2])
+        self.assertEqual(transfers.transfer_line_ids.receiver_desk_id, self.desk_b | self.desk_c)
+        lines = transfers.transfer_line_ids
+        self.assertEqual(lines.mapped("status_destination"), ["pending"] * 3)
+        self.assertEqual(lines.filtered(lambda l: l.receiver_desk_id == self.desk_b).sent_to, self.user_b)
+        self.assertEqual(self.balance(self.desk_a), 35)
+        self.assertEqual(self.balance(self.desk_b), 0)
+
+    def test_transient_transfer_lines(self):
+        # The lines filled in the operation form are read from the commands on save, none is sent before
+        line_vals = self.env["forexmanager.operation"]._transient_transfer_lines([
+            Command.create({"transfer_line_ids": [
+                Command.create({"receiver_desk_id": self.desk_b.id, "currency_id": self.currency.id, "amount": 30}),
+                Command.create({"receiver_desk_id": self.desk_c.id, "currency_id": self.currency.id, "amount": 15}),
+                ]}),
+            Command.create({"transfer_line_ids": []}),
+            ])
+        self.assertEqual(line_vals, [
+            {"receiver_desk_id": self.desk_b.id, "currency_id": self.currency.id, "amount": 30},
+            {"receiver_desk_id": self.desk_c.id, "currency_id": self.currency.id, "amount": 15},
+            ])
+        self.assertFalse(self.env["forexmanager.operation"]._transient_transfer_lines(None))
+
+    def test_send_lines_over_balance(self):
+        # 60 + 50 is over the balance, even if every line alone is not
+        with self.assertRaises(ValidationError):
+            self.send((self.desk_b, 60), (self.desk_c, 50))
+        self.assertEqual(self.balance(self.desk_a), 100)
+
+    def test_send_lines_to_desk_not_checked_in(self):
+        self.session_c.balances_checked_ended = False
+        with self.assertRaises(ValidationError):
+            self.send((self.desk_b, 10), (self.desk_c, 10))
+        self.assertEqual(self.balance(self.desk_a), 100)
+
+    def test_send_lines_journal(self):
+        # Lines of the same currency are debited at once, but every line keeps its own journal move
+        lines = self.send((self.desk_b, 30), (self.desk_b, 20)).transfer_line_ids
+        moves = self.env["forexmanager.cashcount.move"].search([
+            ("res_model", "=", lines._name),
+            ("res_id", "in", lines.ids),
+            ])
+        self.assertEqual(sorted(moves.mapped("delta_cents")), [-3000, -2000])
+        self.assertEqual(moves.desk_id, self.desk_a)
+
+    def test_receive_transfers(self):
+        lines = self.send((self.desk_b, 30), (self.desk_b, 20)).transfer_line_ids
+        lines.with_user(self.user_b).receive_transfers()
+
+        self.assertEqual(lines.mapped("status_destination"), ["received"] * 2)
+        self.assertEqual(self.balance(self.desk_a), 50)
+        self.assertEqual(self.balance(self.desk_b), 50)
+
+    def test_receive_transfers_journal(self):
+        lines = self.send((self.desk_b, 30), (self.desk_b, 20)).transfer_line_ids
+        lines.with_user(self.user_b).receive_transfers()
+
+        moves = self.env["forexmanager.cashcount.move"].search([
+            ("desk_id", "=", self.desk_b.id),
+            ("res_model", "=", lines._name),
+            ("res_id", "in", lines.ids),
+            ])
+        self.assertEqual(sorted(moves.mapped("delta_cents")), [2000, 3000])
+
+    def test_receive_transfers_twice(self):
+        lines = self.send((self.desk_b, 30)).transfer_line_ids
+        lines.with_user(self.user_b).receive_transfers()
+
+        with self.assertRaises(ValidationError):
+            lines.with_user(self.user_b).receive_transfers()
+        self.assertEqual(self.balance(self.desk_b), 30)
+
+    def test_receive_transfers_not_sent_to_user(self):
+        lines = self.send((self.desk_b, 30), (self.desk_c, 20)).transfer_line_ids
+
+        # The whole selection is rejected if one line is for another user
+        with self.assertRaises(ValidationError):
+            lines.with_user(self.user_b).receive_transfers()
+        self.assertEqual(lines.mapped("status_destination"), ["pending"] * 2)
+        self.assertEqual(self.balance(self.desk_b), 0)
+
+    def test_reject_then_receive(self):
+        lines = self.send((self.desk_b, 30)).transfer_line_ids
+        lines.with_user(self.user_b).reject_transfers()
+
+        with self.assertRaises(ValidationError):
+            lines.with_user(self.user_b).receive_transfers()
+        self.assertEqual(lines.status_destination, "rejected")
+        self.assertEqual(self.balance(self.desk_b), 0)
@@ -1,18 +1,125 @@
+import logging
+import re
 import requests
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
 from odoo.exceptions import UserError, ValidationError
-        
 
-def get_base_rate(from_currency, to_currency):
-    URL = f"https://api.frankfurter.dev/v1/latest?base={from_currency}&symbols={to_currency}"
+
+RATES_API_URL = "https://api.frankfurter.dev/v1/latest"
+RATES_API_TIMEOUT = 5 # seconds
+
+
+def get_base_rates(from_currency, to_currencies):
+    # One single request for all the currencies (symbols=USD,GBP,...). Returns {currency: rate}
+    # With no to_currencies, the API returns every currency it supports
+    params = {"base": from_currency}
+    if to_currencies:
+        params["symbols"] = ",".join(sorted(set(to_currencies)))
     
     try:
-        rate = requests.get(URL).json()["rates"][to_currency]
+        response = requests.get(RATES_API_URL, params=params, timeout=RATES_API_TIMEOUT)
+        response.raise_for_status()
+        rates = response.json()["rates"]
     except requests.exceptions.RequestException as e:
         raise UserError(f"Error al intentar convertir la cantidad a la moneda seleccionada. No se pudo obtener el tipo de cambio: {e}")
     except KeyError:
         raise UserError("Error al intentar convertir la cantidad a la moneda seleccionada. Moneda no soportada para esta API.")
     
-    return rate
+    return rates
+
+
+class TTLCache:
+    """An in-process LRU cache where every entry expires after ttl seconds."""
+
+    def __init__(self, maxsize=256, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict() # {key: (expires_at, value)}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            if item[0] < time.monotonic(): # Expired
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize: # Evict the least recently used
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return item[1] if item else default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+# Onchange profiling (only with the DEBUG log level): recomputations of computed fields during one onchange call
+_onchange_stats = ContextVar("forexmanager_onchange_stats", default=None)
+
+def profiled_onchange(records, logger, onchange, *args):
+    # Runs onchange(*args) counting the fields recomputed (see count_recompute()), and logs them
+    if not logger.isEnabledFor(logging.DEBUG) or _onchange_stats.get() is not None:
+        return onchange(*args)
+
+    stats = Counter()
+    token = _onchange_stats.set(stats)
+    start = time.perf_counter()
+    try:
+        return onchange(*args)
+    finally:
+        _onchange_stats.reset(token)
+        logger.debug("Onchange %s %s: %d recomputations in %.1f ms %s", records._name, args[1], sum(stats.values()),
+                     (time.perf_counter() - start) * 1000, dict(stats.most_common(10)))
+
+def count_recompute(field):
+    stats = _onchange_stats.get()
+    if stats is not None:
+        stats[str(field)] += 1
+
+def normalize_document_number(number):
+    # Same number whatever the way it was typed or read from the MRZ: uppercase, no spaces, "<" fillers, dots or dashes
+    return re.sub(r"[\s<.\-]", "", number or "").upper()
+
+# The MRZ writes the countries as ISO 3166-1 alpha-3 (ESP), res.country codes are alpha-2 (ES)
+MRZ_COUNTRY_CODES = dict(pair.split(":") for pair in (
+    "ABW:AW AFG:AF AGO:AO AIA:AI ALA:AX ALB:AL AND:AD ARE:AE ARG:AR ARM:AM ASM:AS ATA:AQ ATF:TF ATG:AG AUS:AU AUT:AT "
+    "AZE:AZ BDI:BI BEL:BE BEN:BJ BES:BQ BFA:BF BGD:BD BGR:BG BHR:BH BHS:BS BIH:BA BLM:BL BLR:BY BLZ:BZ BMU:BM BOL:BO "
+    "BRA:BR BRB:BB BRN:BN BTN:BT BVT:BV BWA:BW CAF:CF CAN:CA CCK:CC CHE:CH CHL:CL CHN:CN CIV:CI CMR:CM COD:CD COG:CG "
+    "COK:CK COL:CO COM:KM CPV:CV CRI:CR CUB:CU CUW:CW CXR:CX CYM:KY CYP:CY CZE:CZ DEU:DE DJI:DJ DMA:DM DNK:DK DOM:DO "
+    "DZA:DZ ECU:EC EGY:EG ERI:ER ESH:EH ESP:ES EST:EE ETH:ET FIN:FI FJI:FJ FLK:FK FRA:FR FRO:FO FSM:FM GAB:GA GBR:GB "
+    "GEO:GE GGY:GG GHA:GH GIB:GI GIN:GN GLP:GP GMB:GM GNB:GW GNQ:GQ GRC:GR GRD:GD GRL:GL GTM:GT GUF:GF GUM:GU GUY:GY "
+    "HKG:HK HMD:HM HND:HN HRV:HR HTI:HT HUN:HU IDN:ID IMN:IM IND:IN IOT:IO IRL:IE IRN:IR IRQ:IQ ISL:IS ISR:IL ITA:IT "
+    "JAM:JM JEY:JE JOR:JO JPN:JP KAZ:KZ KEN:KE KGZ:KG KHM:KH KIR:KI KNA:KN KOR:KR KWT:KW LAO:LA LBN:LB LBR:LR LBY:LY "
+    "LCA:LC LIE:LI LKA:LK LSO:LS LTU:LT LUX:LU LVA:LV MAC:MO MAF:MF MAR:MA MCO:MC MDA:MD MDG:MG MDV:MV MEX:MX MHL:MH "
+    "MKD:MK MLI:ML MLT:MT MMR:MM MNE:ME MNG:MN MNP:MP MOZ:MZ MRT:MR MSR:MS MTQ:MQ MUS:MU MWI:MW MYS:MY MYT:YT NAM:NA "
+    "NCL:NC NER:NE NFK:NF NGA:NG NIC:NI NIU:NU NLD:NL NOR:NO NPL:NP NRU:NR NZL:NZ OMN:OM PAK:PK PAN:PA PCN:PN PER:PE "
+    "PHL:PH PLW:PW PNG:PG POL:PL PRI:PR PRK:KP PRT:PT PRY:PY PSE:PS PYF:PF QAT:QA REU:RE ROU:RO RUS:RU RWA:RW SAU:SA "
+    "SDN:SD SEN:SN SGP:SG SGS:GS SHN:SH SJM:SJ SLB:SB SLE:SL SLV:SV SMR:SM SOM:SO SPM:PM SRB:RS SSD:SS STP:ST SUR:SR "
+    "SVK:SK SVN:SI SWE:SE SWZ:SZ SXM:SX SYC:SC SYR:SY TCA:TC TCD:TD TGO:TG THA:TH TJK:TJ TKL:TK TKM:TM TLS:TL TON:TO "
+    "TTO:TT TUN:TN TUR:TR TUV:TV TWN:TW TZA:TZ UGA:UG UKR:UA UMI:UM URY:UY USA:US UZB:UZ VAT:VA VCT:VC VEN:VE VGB:VG "
+    "VIR:VI VNM:VN VUT:VU WLF:WF WSM:WS YEM:YE ZAF:ZA ZMB:ZM ZWE:ZW "
+    # Codes used only in travel documents (ICAO 9303)
+    "D:DE GBD:GB GBN:GB GBO:GB GBP:GB GBS:GB RKS:XK"
+).split())
+
+def mrz_country_code(code):
+    # Alpha-2 code of the country read from the MRZ ("ESP" or "D<<" -> "ES", "DE"). False if unknown
+    code = (code or "").replace("<", "").upper()
+    return MRZ_COUNTRY_CODES.get(code, code if len(code) == 2 else False)
 
 def notification(self, title, body, message_type, sticky=False):
     self.env["bus.bus"]._sendone(